@@ -0,0 +1,107 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+''' Raw socket client for ddserver-dns.
+
+    Sends A queries for the given names over UDP keeping a window of queries
+    in flight and reports the answers per response code, the queries per
+    second and the latency percentiles. With a count of one, the response is
+    printed instead.
+
+      PYTHONPATH=. python benchmarks/nameserver.py 127.0.0.1 53 host.dyn.example.com 100000
+'''
+
+import sys
+import time
+import socket
+import random
+import select
+import collections
+
+from ddserver.nameserver import wire
+
+
+
+def query(id, name, qtype = 1):
+  return (wire.HEADER.pack(id, wire.FLAG_RD, 1, 0, 0, 0) +
+          wire.encode_name(name) +
+          wire.QUESTION.pack(qtype, wire.CLASS_IN))
+
+
+
+def main(host, port, names, count = 1, window = 64):
+  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  sock.connect((host, port))
+
+  if count == 1:
+    sock.send(query(1, names[0]))
+    response = sock.recv(65535)
+
+    id, flags, qd, an, ns, ar = wire.HEADER.unpack_from(response, 0)
+    print 'id=%d flags=%04x rcode=%d qd=%d an=%d ns=%d ar=%d' % (id, flags, flags & 0xF, qd, an, ns, ar)
+    print repr(response)
+    return
+
+  pending = {}
+  latencies = []
+  rcodes = collections.Counter()
+
+  sent = 0
+  started = time.time()
+
+  while len(latencies) < count:
+    # Fill the window
+    while sent < count and len(pending) < window:
+      id = sent & 0xFFFF
+      pending[id] = time.time()
+      sock.send(query(id, random.choice(names)))
+      sent += 1
+
+    readable, _, _ = select.select([sock], [], [], 1.0)
+    if not readable:
+      # Treat lost datagrams as answered to not stall the run
+      latencies.extend([1.0] * len(pending))
+      rcodes['lost'] += len(pending)
+      pending.clear()
+      continue
+
+    response = sock.recv(65535)
+    id, flags, _, _, _, _ = wire.HEADER.unpack_from(response, 0)
+
+    if id in pending:
+      latencies.append(time.time() - pending.pop(id))
+      rcodes[flags & 0xF] += 1
+
+  duration = time.time() - started
+
+  latencies.sort()
+
+  print 'queries:  %d in %.2fs' % (count, duration)
+  print 'qps:      %.0f' % (count / duration)
+  print 'p50:      %.3fms' % (latencies[len(latencies) // 2] * 1000)
+  print 'p99:      %.3fms' % (latencies[int(len(latencies) * 0.99)] * 1000)
+  print 'rcodes:   %s' % dict(rcodes)
+
+
+
+if __name__ == '__main__':
+  main(host = sys.argv[1],
+       port = int(sys.argv[2]),
+       names = sys.argv[3].split(','),
+       count = int(sys.argv[4]) if len(sys.argv) > 4 else 1)
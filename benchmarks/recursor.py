@@ -0,0 +1,310 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+''' Replay benchmark of the recursor.
+
+    Feeds a stream of pipe protocol messages into ddserver-recursor running in
+    a subprocess and measures the time until each message is answered. The
+    recursor uses an in-memory SQLite database as stand-in for MySQL, seeded
+    with the given number of hosts. Each query to the stand-in can be delayed
+    to simulate the round trip to a database server.
+
+    The stream is either synthetic or read from a file containing recorded
+    pipe protocol lines. The configuration is read from the usual location,
+    options can be overridden using --set.
+
+    Run from the source directory:
+
+      PYTHONPATH=. python benchmarks/recursor.py --hosts 10000 --queries 100000
+      PYTHONPATH=. python benchmarks/recursor.py --replay queries.txt --db-latency 0.5
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import calendar
+import contextlib
+import subprocess
+
+from ddserver.utils.deps import extend, require
+
+
+
+SUFFIX = 'dyn.example.com'
+
+
+
+class StandInDatabase(object):
+  ''' In-memory SQLite database replacing the MySQL database. '''
+
+  PARAMETER = re.compile(r'%\((\w+)\)s')
+
+
+  def __init__(self, hosts, latency):
+    self.__latency = latency
+
+    # Lookups are run in the worker thread of the circuit breaker
+    self.__connection = sqlite3.connect(':memory:', check_same_thread = False)
+    self.__connection.row_factory = lambda cur, row: {column[0]: value
+                                                      for column, value
+                                                      in zip(cur.description, row)}
+    self.__connection.create_function('NOW', 0,
+                                      lambda: time.strftime('%Y-%m-%d %H:%M:%S'))
+    self.__connection.create_function('UNIX_TIMESTAMP', 1,
+                                      lambda value: calendar.timegm(time.strptime(value, '%Y-%m-%d %H:%M:%S')))
+
+    self.__connection.executescript('''
+        CREATE TABLE `suffixes` (
+          `id` INTEGER PRIMARY KEY,
+          `name` VARCHAR(255) NOT NULL UNIQUE,
+          `serial` INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE `hosts` (
+          `id` INTEGER PRIMARY KEY,
+          `hostname` VARCHAR(255) NOT NULL,
+          `suffix_id` INTEGER NOT NULL,
+          `fqdn` VARCHAR(255) NOT NULL UNIQUE,
+          `address` VARCHAR(15) NULL,
+          `updated` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE `tombstones` (
+          `fqdn` VARCHAR(255) NOT NULL,
+          `deleted` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+    self.__connection.execute('''
+        INSERT INTO `suffixes` (`id`, `name`)
+        VALUES (1, ?)
+    ''', (SUFFIX,))
+
+    self.__connection.executemany('''
+        INSERT INTO `hosts` (`hostname`, `suffix_id`, `fqdn`, `address`)
+        VALUES (?, 1, ?, ?)
+    ''', (('host%d' % i,
+           'host%d.%s' % (i, SUFFIX),
+           '10.%d.%d.%d' % (i >> 16 & 0xFF, i >> 8 & 0xFF, i & 0xFF))
+          for i
+          in xrange(hosts)))
+
+    self.__connection.commit()
+
+
+  def execute(self, cur, query, args = None):
+    if self.__latency:
+      time.sleep(self.__latency)
+
+    # Convert the MySQL parameter style to the SQLite one
+    query = self.PARAMETER.sub(r':\1', query)
+
+    return cur.execute(query, args or {})
+
+
+  @contextlib.contextmanager
+  def cursor(self, **kwargs):
+    cur = self.__connection.cursor()
+
+    cursor = type('Cursor', (object,), {
+        'execute': lambda _, query, args = None: self.execute(cur, query, args),
+        'fetchone': lambda _: cur.fetchone(),
+        'fetchall': lambda _: cur.fetchall(),
+        '__iter__': lambda _: iter(cur),
+    })()
+
+    try:
+      yield cursor
+
+    finally:
+      self.__connection.commit()
+      cur.close()
+
+
+
+def serve(args):
+  ''' Runs the recursor reading from stdin using the stand-in database. '''
+
+  # Import the recursor first, so its declarations are extended before ours
+  from ddserver.recursor.__main__ import main
+
+  overrides = [option.split('=', 1)
+               for option
+               in args.set]
+
+  @extend('ddserver.config:ConfigDeclaration')
+  def config_standin(config_decl):
+    # The stand-in database does not need any credentials
+    config_decl.declarations['db']['password'] = config_decl.Option(conv = str,
+                                                                    default = '')
+
+
+  @extend('ddserver.config:Config')
+  @require(config_decl = 'ddserver.config:ConfigDeclaration')
+  def config_overrides(config, config_decl):
+    config.logging.file = os.devnull
+
+    for name, value in overrides:
+      section, option = name.split('.', 1)
+
+      conv = config_decl.declarations[section][option].conv
+      config[section][option] = conv(value)
+
+
+  @extend('ddserver.db:Database')
+  def database(db):
+    return StandInDatabase(hosts = args.hosts,
+                           latency = args.db_latency / 1000.0)
+
+  main()
+
+
+
+def synthetic(args):
+  ''' Generates a stream of queries.
+
+      The names are drawn from a working set of the given size, where a share
+      of the names does not exist. Every 1000th message is a ping.
+  '''
+
+  rng = random.Random(args.seed)
+
+  names = ['host%d.%s' % (rng.randrange(args.hosts), SUFFIX)
+           if rng.random() >= args.missing
+           else 'missing%d.%s' % (i, SUFFIX)
+           for i
+           in xrange(args.names)]
+
+  for i in xrange(args.queries):
+    if i % 1000 == 999:
+      yield 'PING'
+
+    elif rng.random() < args.soa:
+      yield 'Q\t%s\tIN\tSOA\t-1\t192.0.2.1' % SUFFIX
+
+    else:
+      yield 'Q\t%s\tIN\tANY\t-1\t192.0.2.1' % rng.choice(names)
+
+
+
+def recorded(path):
+  ''' Reads a stream of recorded messages. '''
+
+  with open(path) as f:
+    for line in f:
+      line = line.rstrip('\n')
+
+      # The handshake is done before the replay
+      if line and not line.startswith('HELO'):
+        yield line
+
+
+
+def run(args):
+  ''' Feeds the messages into the recursor and measures the answer times. '''
+
+  command = [sys.executable, os.path.abspath(__file__), '--serve']
+  command += [argument
+              for argument
+              in sys.argv[1:]]
+
+  recursor = subprocess.Popen(command,
+                              stdin = subprocess.PIPE,
+                              stdout = subprocess.PIPE)
+
+  def exchange(line):
+    recursor.stdin.write(line + '\n')
+    recursor.stdin.flush()
+
+    while True:
+      response = recursor.stdout.readline()
+
+      if not response:
+        raise EOFError('Recursor terminated')
+
+      if response.startswith(('END', 'FAIL', 'OK')):
+        return
+
+  # Wait for the recursor to load before measuring
+  exchange('HELO\t1')
+
+  messages = list(recorded(args.replay) if args.replay else synthetic(args))
+
+  latencies = []
+
+  started = time.time()
+
+  for message in messages:
+    sent = time.time()
+    exchange(message)
+    latencies.append(time.time() - sent)
+
+  duration = time.time() - started
+
+  recursor.stdin.close()
+  recursor.wait()
+
+  latencies.sort()
+
+  print 'messages: %d in %.2fs' % (len(latencies), duration)
+  print 'qps:      %.0f' % (len(latencies) / duration)
+  print 'p50:      %.3fms' % (latencies[len(latencies) // 2] * 1000)
+  print 'p99:      %.3fms' % (latencies[int(len(latencies) * 0.99)] * 1000)
+  print 'max:      %.3fms' % (latencies[-1] * 1000)
+
+
+
+def main():
+  parser = argparse.ArgumentParser(description = 'Replay benchmark of the recursor')
+  parser.add_argument('--hosts', type = int, default = 10000,
+                      help = 'number of hosts in the stand-in database')
+  parser.add_argument('--queries', type = int, default = 100000,
+                      help = 'number of synthetic messages')
+  parser.add_argument('--names', type = int, default = 1000,
+                      help = 'number of distinct names queried')
+  parser.add_argument('--missing', type = float, default = 0.1,
+                      help = 'share of names not existing')
+  parser.add_argument('--soa', type = float, default = 0.05,
+                      help = 'share of SOA queries')
+  parser.add_argument('--seed', type = int, default = 0,
+                      help = 'seed of the synthetic stream')
+  parser.add_argument('--replay', metavar = 'FILE',
+                      help = 'file of recorded messages to replay')
+  parser.add_argument('--db-latency', type = float, default = 0.0,
+                      help = 'delay of each database query in milliseconds')
+  parser.add_argument('--set', action = 'append', default = [],
+                      metavar = 'SECTION.OPTION=VALUE',
+                      help = 'override a configuration option')
+  parser.add_argument('--serve', action = 'store_true',
+                      help = argparse.SUPPRESS)
+
+  args = parser.parse_args()
+
+  if args.serve:
+    serve(args)
+
+  else:
+    run(args)
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,111 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+''' Micro-benchmarks of the generated lexers and formatters against the
+    generic implementation in ddserver.utils.txtprot.
+
+    Run from the source directory:
+
+      PYTHONPATH=. python benchmarks/txtprot.py
+'''
+
+import timeit
+
+from ddserver.utils.txtprot import (LexerDeclaration,
+                                    FormatterDeclaration,
+                                    MessageDeclaration,
+                                    FieldDeclaration)
+
+
+
+Q = MessageDeclaration('Q',
+                       FieldDeclaration('qname', str),
+                       FieldDeclaration('qclass', str),
+                       FieldDeclaration('qtype', str),
+                       FieldDeclaration('id', int),
+                       FieldDeclaration('remote', str))
+
+DATA = MessageDeclaration('DATA',
+                          FieldDeclaration('qname', str),
+                          FieldDeclaration('qclass', str),
+                          FieldDeclaration('qtype', str),
+                          FieldDeclaration('ttl', str),
+                          FieldDeclaration('id', int),
+                          FieldDeclaration('content', str))
+
+lexer = LexerDeclaration(splitter = '\t',
+                         messages = (Q,))
+
+formatter = FormatterDeclaration(splitter = '\t',
+                                 messages = (DATA,))
+
+
+LINE = 'Q\thost.dyn.example.com\tIN\tA\t-1\t192.0.2.1\n'
+
+VALUES = LINE.strip().split('\t')[1:]
+
+MESSAGE = DATA(qname = 'host.dyn.example.com',
+               qclass = 'IN',
+               qtype = 'A',
+               ttl = 60,
+               id = -1,
+               content = '192.0.2.1')
+
+
+
+def generic_lex():
+  return Q.lex(VALUES)
+
+
+def generated_lex():
+  return Q.lexer(VALUES)
+
+
+def generic_format():
+  return '\t'.join([MESSAGE.tag] + DATA.format(MESSAGE))
+
+
+def generated_format():
+  return formatter(MESSAGE)
+
+
+def line_lex():
+  return lexer(LINE)
+
+
+
+def main(number = 200000):
+  assert generic_lex() == generated_lex()
+  assert generic_format() == generated_format()
+
+  for name, func in (('lex (generic)', generic_lex),
+                     ('lex (generated)', generated_lex),
+                     ('lex line (generated)', line_lex),
+                     ('format (generic)', generic_format),
+                     ('format (generated)', generated_format)):
+    duration = min(timeit.repeat(func,
+                                 number = number,
+                                 repeat = 3))
+
+    print '%-24s %8.3f us/op' % (name, duration / number * 1e6)
+
+
+
+if __name__ == '__main__':
+  main()
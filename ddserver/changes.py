@@ -0,0 +1,115 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from ddserver.utils.deps import extend, require
+
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_changes(config_decl):
+  with config_decl.declare('dns') as s:
+    s('changes_keep',
+      conv = int,
+      default = 7)
+
+
+
+@require(config = 'ddserver.config:Config')
+def record_changes(cur, condition, args, config, address = None, created = False):
+  ''' Records the address changes of the hosts matching the condition.
+
+      The change log is used to derive the SOA serials of the suffixes and to
+      answer incremental zone transfers. The changes must be recorded using
+      the cursor of the transaction changing the hosts, before the hosts are
+      changed. The suffixes of the hosts stay locked until the transaction
+      ends.
+
+      @param condition: the SQL condition selecting the changed hosts
+      @param args: the arguments of the condition
+      @param address: the new address of the hosts or None if the hosts are
+                      deleted or taken offline
+      @param created: True if the hosts have just been created with the new
+                      address, which is recorded after creating them
+  '''
+
+  args = dict(args, new_address = address)
+
+  old_address = 'NULL' if created else '`address`'
+
+  # The IDs of the changes are assigned on insert but become visible on
+  # commit. Lock the suffixes first, so concurrent changes of a suffix are
+  # committed in the order of their IDs and a zone transfer at the latest
+  # serial never misses a change committed later with a lower ID.
+  cur.execute('''
+      SELECT `id`
+      FROM `suffixes`
+      WHERE `id` IN ( SELECT `suffix_id`
+                      FROM `hosts`
+                      WHERE %(condition)s )
+      ORDER BY `id`
+      FOR UPDATE
+  ''' % {'condition': condition}, args)
+
+  # Hosts keeping their address are not changed
+  cur.execute('''
+      INSERT
+      INTO `changelog` (`suffix_id`, `fqdn`, `old_address`, `address`)
+      SELECT `suffix_id`, `fqdn`, %(old_address)s, %%(new_address)s
+      FROM `hosts`
+      WHERE %(condition)s
+        AND NOT %(old_address)s <=> %%(new_address)s
+  ''' % {'old_address': old_address,
+         'condition': condition}, args)
+
+  if cur.rowcount == 0:
+    return
+
+  # The serial of a suffix is the ID of its latest change
+  cur.execute('''
+      UPDATE `suffixes`
+      SET `serial` = ( SELECT MAX(`id`)
+                       FROM `changelog`
+                       WHERE `changelog`.`suffix_id` = `suffixes`.`id` )
+      WHERE `id` IN ( SELECT `suffix_id`
+                      FROM `hosts`
+                      WHERE %(condition)s )
+  ''' % {'condition': condition}, args)
+
+  # The latest change of each suffix is kept, as it is the serial of the
+  # suffix. This keeps the IDs increasing even if the server resets the auto
+  # increment counter to the highest ID left, as MySQL up to 5.7 does on
+  # restart, so serials never go backwards.
+  cur.execute('''
+      DELETE
+      FROM `changelog`
+      WHERE `changed` < NOW() - INTERVAL %(keep)s DAY
+        AND `id` NOT IN ( SELECT `serial`
+                          FROM `suffixes` )
+  ''', {'keep': config.dns.changes_keep})
+
+
+
+def serial_before(serial, other):
+  ''' Checks if a serial is older than another one.
+
+      Serials are compared using serial number arithmetic (see RFC 1982), so
+      the comparison holds if the serials wrap around.
+  '''
+
+  return serial != other and (other - serial) % 2 ** 32 < 2 ** 31
@@ -51,18 +51,52 @@ class Database(object):
 
   thread_local = threading.local()
 
+  # Timeout in seconds for connecting to the database and for each read and
+  # write on the connection or None to wait forever
+  timeout = None
+
+  # Function returning a context manager wrapped around each use of a cursor
+  # or None
+  guard = None
+
+  @contextlib.contextmanager
+  def cursor(self, cursorclass = None):
+    ''' Returns a cursor of the connection of the current thread.
+
+        The cursor class defaults to the DictCursor. An unbuffered cursor
+        class like SSDictCursor can be used to stream large results, but the
+        connection can not be used for other queries until all rows are read.
+    '''
+
+    if self.guard is None:
+      with self.__cursor(cursorclass) as cursor:
+        yield cursor
+
+    else:
+      with self.guard(), self.__cursor(cursorclass) as cursor:
+        yield cursor
+
+
   @contextlib.contextmanager
   @require(config = 'ddserver.config:Config')
-  def cursor(self, config):
+  def __cursor(self, cursorclass, config):
+
     # Ensure we have a connection for this thread
     if not hasattr(self.thread_local, 'connection'):
+      timeouts = {}
+      if self.timeout is not None:
+        timeouts = {'connect_timeout': self.timeout,
+                    'read_timeout': self.timeout,
+                    'write_timeout': self.timeout}
+
       connection = MySQLdb.connect(host = config.db.host,
                                    port = config.db.port,
                                    user = config.db.username,
                                    passwd = config.db.password,
                                    db = config.db.name,
                                    cursorclass = MySQLdb.cursors.DictCursor,
-                                   charset = 'utf8')
+                                   charset = 'utf8',
+                                   **timeouts)
       setattr(self.thread_local, 'connection', connection)
 
     else:
@@ -72,7 +106,7 @@ class Database(object):
       # Reconnect if connection is down
       connection.ping(True)
 
-    cursor = connection.cursor()
+    cursor = connection.cursor(cursorclass)
 
     try:
       yield cursor
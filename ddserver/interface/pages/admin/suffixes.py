@@ -22,6 +22,7 @@ import bottle
 from ddserver.web import route
 
 from ddserver.utils.deps import require
+from ddserver.changes import record_changes
 
 from ddserver.interface.user import authorized_admin
 
@@ -73,10 +74,12 @@ def get_suffix_add(user,
 @validate('/admin/suffixes/add',
           suffix_name = validation.ValidSuffix(min = 1, max = 255))
 @require(db = 'ddserver.db:Database',
+         registry = 'ddserver.suffixes:SuffixRegistry',
          messages = 'ddserver.interface.message:MessageManager')
 def post_suffix_add(user,
                     data,
                     db,
+                    registry,
                     messages):
   ''' Add a new suffix. '''
 
@@ -97,6 +100,8 @@ def post_suffix_add(user,
       SET `name` = %(name)s
     ''', {'name': data.suffix_name})
 
+  registry.invalidate()
+
   messages.success('Ok, done.')
 
   bottle.redirect('/admin/suffixes/list')
@@ -108,20 +113,58 @@ def post_suffix_add(user,
 @validate('/admin/suffixes/list',
           suffix_id = validation.Int(not_empty = True))
 @require(db = 'ddserver.db:Database',
+         registry = 'ddserver.suffixes:SuffixRegistry',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_suffix_delete(user,
                        data,
                        db,
+                       registry,
+                       publisher,
                        messages):
   ''' Delete a suffix. '''
 
   with db.cursor() as cur:
+    cur.execute('''
+        SELECT `name` AS `fqdn`
+        FROM `suffixes`
+        WHERE `id` = %(suffix_id)s
+        UNION ALL
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `suffix_id` = %(suffix_id)s
+    ''', {'suffix_id': data.suffix_id})
+    hosts = cur.fetchall()
+
+    # Remember the names of the hosts deleted with the suffix for the zone
+    # replicas
+    cur.execute('''
+        INSERT
+        INTO `tombstones` (`fqdn`)
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `suffix_id` = %(suffix_id)s
+    ''', {'suffix_id': data.suffix_id})
+
     cur.execute('''
       DELETE
       FROM `suffixes`
       WHERE id = %(suffix_id)s
     ''', {'suffix_id': data.suffix_id})
 
+    cur.execute('''
+        DELETE
+        FROM `tombstones`
+        WHERE `deleted` < NOW() - INTERVAL 1 DAY
+    ''')
+
+  registry.invalidate()
+
+  # Evict the suffix and its hosts deleted with it from the caches
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   messages.success('Ok, done.')
 
   bottle.redirect('/admin/suffixes/list')
@@ -168,20 +211,51 @@ def get_suffix_hostnames(user,
 @validate('/admin/suffixes/list',
           host_id = validation.Int(not_empty = True))
 @require(db = 'ddserver.db:Database',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_hosts_delete(user,
                       data,
                       db,
+                      publisher,
                       messages):
   ''' Delete a hostname administratively. '''
 
   with db.cursor() as cur:
+    cur.execute('''
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `id` = %(host_id)s
+    ''', {'host_id': data.host_id})
+    hosts = cur.fetchall()
+
+    record_changes(cur, '`id` = %(host_id)s',
+                   {'host_id': data.host_id})
+
+    # Remember the name of the host for the zone replicas
+    cur.execute('''
+        INSERT
+        INTO `tombstones` (`fqdn`)
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `id` = %(host_id)s
+    ''', {'host_id': data.host_id})
+
     cur.execute('''
         DELETE
         FROM hosts
         WHERE id = %(host_id)s
     ''', {'host_id': data.host_id})
 
+    cur.execute('''
+        DELETE
+        FROM `tombstones`
+        WHERE `deleted` < NOW() - INTERVAL 1 DAY
+    ''')
+
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   messages.success('Ok, done.')
 
   bottle.redirect('/admin/suffixes/list')
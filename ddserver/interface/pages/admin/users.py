@@ -22,6 +22,7 @@ import bottle
 from ddserver.web import route
 
 from ddserver.utils.deps import require
+from ddserver.changes import record_changes
 
 from ddserver.interface.user import authorized_admin
 
@@ -183,20 +184,52 @@ def post_users_activate(user,
 @validate('/admin/users/all',
           user_id = validation.Int(not_empty = True))
 @require(db = 'ddserver.db:Database',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_users_delete(user,
                       data,
                       db,
+                      publisher,
                       messages):
   ''' Delete a users account. '''
 
   with db.cursor() as cur:
+    cur.execute('''
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `user_id` = %(user_id)s
+    ''', {'user_id': data.user_id})
+    hosts = cur.fetchall()
+
+    record_changes(cur, '`user_id` = %(user_id)s',
+                   {'user_id': data.user_id})
+
+    # Remember the names of the hosts deleted with the user for the zone
+    # replicas
+    cur.execute('''
+        INSERT
+        INTO `tombstones` (`fqdn`)
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `user_id` = %(user_id)s
+    ''', {'user_id': data.user_id})
+
     cur.execute('''
         DELETE
         FROM `users`
         WHERE `id` = %(user_id)s
     ''', { 'user_id': data.user_id})
 
+    cur.execute('''
+        DELETE
+        FROM `tombstones`
+        WHERE `deleted` < NOW() - INTERVAL 1 DAY
+    ''')
+
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   messages.success('Ok, done.')
 
   bottle.redirect('/admin/users/all')
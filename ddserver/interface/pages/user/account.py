@@ -22,6 +22,7 @@ import bottle
 from ddserver.web import route
 
 from ddserver.utils.deps import extend, require
+from ddserver.changes import record_changes
 
 from ddserver.interface.user import authorized
 from ddserver.interface.user import authorized_by_code
@@ -113,20 +114,52 @@ def post_account_password(user,
 @authorized()
 @require(db = 'ddserver.db:Database',
          auth = 'ddserver.interface.user:UserManager',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_account_delete(user,
                         db,
                         auth,
+                        publisher,
                         messages):
   ''' Delete the users account. '''
 
   with db.cursor() as cur:
+    cur.execute('''
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `user_id` = %(id)s
+    ''', {'id': user.id})
+    hosts = cur.fetchall()
+
+    record_changes(cur, '`user_id` = %(user_id)s',
+                   {'user_id': user.id})
+
+    # Remember the names of the hosts deleted with the user for the zone
+    # replicas
+    cur.execute('''
+        INSERT
+        INTO `tombstones` (`fqdn`)
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `user_id` = %(id)s
+    ''', {'id': user.id})
+
     cur.execute('''
         DELETE
         FROM users
         WHERE id = %(id)s
     ''', {'id': user.id})
 
+    cur.execute('''
+        DELETE
+        FROM `tombstones`
+        WHERE `deleted` < NOW() - INTERVAL 1 DAY
+    ''')
+
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   auth.logout()
 
   bottle.redirect('/')
@@ -22,6 +22,7 @@ import bottle
 from ddserver.web import route
 
 from ddserver.utils.deps import extend, require
+from ddserver.changes import record_changes
 
 from ddserver.interface.user import authorized
 
@@ -81,19 +82,36 @@ def get_host_display(user,
           description = validation.String(max = 255))
 @require(db = 'ddserver.db:Database',
          config = 'ddserver.config:Config',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_host_update_address(user,
                              data,
                              db,
                              config,
+                             publisher,
                              messages):
   ''' Update the IP address and/or description of a hostname. '''
 
   with db.cursor() as cur:
+    cur.execute('''
+      SELECT `fqdn`
+      FROM `hosts`
+      WHERE `id` = %(host_id)s
+        AND `user_id` = %(user_id)s
+    ''', {'host_id': data.host_id,
+          'user_id': user.id})
+    hosts = cur.fetchall()
+
+    record_changes(cur, '`id` = %(host_id)s AND `user_id` = %(user_id)s',
+                   {'host_id': data.host_id,
+                    'user_id': user.id},
+                   address = data.address)
+
     cur.execute('''
       UPDATE `hosts`
         SET  `address` = %(address)s,
-             `description` = %(description)s
+             `description` = %(description)s,
+             `updated` = CURRENT_TIMESTAMP
       WHERE  `id` = %(host_id)s
         AND  `user_id` = %(user_id)s
     ''', {'address': data.address,
@@ -101,6 +119,10 @@ def post_host_update_address(user,
           'host_id': data.host_id,
           'user_id': user.id})
 
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   messages.success('Ok, done.')
 
   bottle.redirect('/user/hosts/list')
@@ -116,17 +138,28 @@ def post_host_update_address(user,
           chained_validators = [validation.FieldsMatch('password', 'password_confirm')])
 @require(db = 'ddserver.db:Database',
          config = 'ddserver.config:Config',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_host_update_password(user,
                               data,
                               db,
                               config,
+                              publisher,
                               messages):
   ''' Update the password of a hostname. '''
 
   encrypted_password = pwd.encrypt(data.password)
 
   with db.cursor() as cur:
+    cur.execute('''
+      SELECT `fqdn`
+      FROM `hosts`
+      WHERE `id` = %(host_id)s
+        AND `user_id` = %(user_id)s
+    ''', {'host_id': data.host_id,
+          'user_id': user.id})
+    hosts = cur.fetchall()
+
     cur.execute('''
       UPDATE `hosts`
         SET  `password` = %(password)s
@@ -136,6 +169,11 @@ def post_host_update_password(user,
           'host_id': data.host_id,
           'user_id': user.id})
 
+  # The updater must not accept the old password anymore
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   messages.success('Ok, done.')
 
   bottle.redirect('/user/hosts/list')
@@ -22,6 +22,7 @@ import bottle
 from ddserver.web import route
 
 from ddserver.utils.deps import extend, require
+from ddserver.changes import record_changes
 
 from ddserver.interface.user import authorized
 
@@ -73,24 +74,18 @@ def get_hosts_display(user,
 
 @route('/user/hosts/add', method = 'GET')
 @authorized()
-@require(db = 'ddserver.db:Database',
-         config = 'ddserver.config:Config',
+@require(registry = 'ddserver.suffixes:SuffixRegistry',
          templates = 'ddserver.interface.template:TemplateManager')
 def get_hosts_add(user,
-                  db,
-                  config,
+                  registry,
                   templates):
-  ''' Display a form for adding new hostnames '''
+  ''' Display a form for adding new hostnames
 
-  with db.cursor() as cur:
-    # Get all available suffixes
-    cur.execute('''
-        SELECT *
-        FROM `suffixes`
-    ''')
-    suffixes = cur.fetchall()
+      The suffixes are listed from the registry. A suffix deleted meanwhile
+      is rejected by the database when the host is added.
+  '''
 
-  return templates['addhost.html'](suffixes = suffixes,
+  return templates['addhost.html'](suffixes = registry.suffixes,
                                    current_ip = bottle.request.remote_addr)
 
 
@@ -108,11 +103,13 @@ def get_hosts_add(user,
                                 validation.UniqueHostname('hostname', 'suffix')])
 @require(db = 'ddserver.db:Database',
          config = 'ddserver.config:Config',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_hosts_add(user,
                    data,
                    db,
                    config,
+                   publisher,
                    messages):
   ''' Add a new hostname. '''
 
@@ -139,6 +136,9 @@ def post_hosts_add(user,
       INSERT
       INTO `hosts`
       SET `hostname` = %(hostname)s,
+          `fqdn` = CONCAT(%(hostname)s, '.', ( SELECT `name`
+                                               FROM `suffixes`
+                                               WHERE `id` = %(suffix_id)s )),
           `address` = %(address)s,
           `description` = %(description)s,
           `password` = %(password)s,
@@ -151,6 +151,25 @@ def post_hosts_add(user,
           'user_id': user.id,
           'suffix_id': data.suffix})
 
+    host_id = cur.lastrowid
+
+    record_changes(cur, '`id` = %(host_id)s',
+                   {'host_id': host_id},
+                   address = data.address,
+                   created = True)
+
+    cur.execute('''
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `id` = %(host_id)s
+    ''', {'host_id': host_id})
+    hosts = cur.fetchall()
+
+  # The name may have been cached as non-existing
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   messages.success('Ok, done.')
 
   bottle.redirect('/user/hosts/list')
@@ -162,10 +181,12 @@ def post_hosts_add(user,
 @validate('/user/hosts/list',
           host_id = validation.Int(not_empty = True))
 @require(db = 'ddserver.db:Database',
+         publisher = 'ddserver.invalidation:Publisher',
          messages = 'ddserver.interface.message:MessageManager')
 def post_hosts_delete(user,
                       data,
                       db,
+                      publisher,
                       messages):
   ''' Delete a hostname. '''
 
@@ -173,6 +194,30 @@ def post_hosts_delete(user,
   # host of the user
 
   with db.cursor() as cur:
+    cur.execute('''
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `id` = %(host_id)s
+          AND `user_id` = %(user_id)s
+    ''', {'host_id': data.host_id,
+          'user_id': user.id})
+    hosts = cur.fetchall()
+
+    record_changes(cur, '`id` = %(host_id)s AND `user_id` = %(user_id)s',
+                   {'host_id': data.host_id,
+                    'user_id': user.id})
+
+    # Remember the name of the host for the zone replicas
+    cur.execute('''
+        INSERT
+        INTO `tombstones` (`fqdn`)
+        SELECT `fqdn`
+        FROM `hosts`
+        WHERE `id` = %(host_id)s
+          AND `user_id` = %(user_id)s
+    ''', {'host_id': data.host_id,
+          'user_id': user.id})
+
     cur.execute('''
         DELETE
         FROM hosts
@@ -181,6 +226,16 @@ def post_hosts_delete(user,
     ''', {'host_id': data.host_id,
           'user_id': user.id})
 
+    cur.execute('''
+        DELETE
+        FROM `tombstones`
+        WHERE `deleted` < NOW() - INTERVAL 1 DAY
+    ''')
+
+  publisher.publish([host['fqdn']
+                     for host
+                     in hosts])
+
   messages.success('Ok, done.')
 
   bottle.redirect('/user/hosts/list')
@@ -65,21 +65,36 @@ class UserManager(object):
 
 
   @require(session = 'ddserver.interface.session:SessionManager',
-           messages = 'ddserver.interface.message:MessageManager')
+           messages = 'ddserver.interface.message:MessageManager',
+           blocklist = 'ddserver.utils.blocklist:AuthBlocklist')
   def login(self,
             session,
             messages,
+            blocklist,
             username,
             password):
     ''' Tries to authenticate the session.
 
+        Clients and users failing to authenticate repeatedly are rejected
+        without checking the password.
+
         @param username: the name of the user to authenticate
         @param password: the password for the user
     '''
 
+    keys = (('address', bottle.request.remote_addr),
+            ('user', username.lower()))
+
+    if blocklist.blocked(*keys):
+      messages.error('Too many failed login attempts. Please try again later.')
+
+      return False
+
     user = self[username]
 
     if not user or not pwd.verify(password, user.password):
+      blocklist.failure(*keys)
+
       messages.error('The username or password you entered was incorrect.')
 
       return False
@@ -90,6 +105,10 @@ class UserManager(object):
       return False
 
     else:
+      # The failures of the client address are kept, as a successful login
+      # does not vouch for other users guessed from the same address
+      blocklist.success(('user', username.lower()))
+
       session.username = username
       session.save()
 
@@ -0,0 +1,224 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import errno
+import atexit
+import socket
+
+from ddserver.utils.deps import extend, export, require
+
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_invalidation(config_decl):
+  with config_decl.declare('invalidation') as s:
+    s('directory',
+      conv = str,
+      default = '')
+    s('mode',
+      conv = lambda v: int(v, 8),
+      default = 0660)
+
+
+
+# Maximum size of a datagram sent by the publisher
+DATAGRAM_SIZE = 4096
+
+
+
+@export()
+class Publisher(object):
+  ''' Publishes the names of changed hosts to all subscribers.
+
+      Each subscriber binds a UNIX datagram socket in the invalidation
+      directory. The names are sent to all sockets found in the directory,
+      separated by newlines. Sockets left behind by terminated subscribers are
+      removed.
+
+      Publishing never blocks - if the queue of a subscriber is full, the names
+      are dropped for this subscriber and its cache expires as usual.
+
+      The names are purged from the caches of PowerDNS, too.
+  '''
+
+  def __init__(self):
+    self.__socket = None
+
+
+  @require(config = 'ddserver.config:Config',
+           logger = 'ddserver.utils.logger:Logger',
+           purger = 'ddserver.purge:Purger')
+  def publish(self, names, config, logger, purger):
+    ''' Publishes the given names. '''
+
+    if not names:
+      return
+
+    purger.purge(names)
+
+    if not config.invalidation.directory:
+      return
+
+    if self.__socket is None:
+      self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+      self.__socket.setblocking(False)
+
+    # Pack the names into as few datagrams as possible
+    datagrams = ['']
+    for name in names:
+      name = name.lower().encode('utf8')
+
+      if len(datagrams[-1]) + len(name) + 1 > DATAGRAM_SIZE:
+        datagrams.append('')
+
+      datagrams[-1] += name + '\n'
+
+    try:
+      entries = os.listdir(config.invalidation.directory)
+
+    except OSError, e:
+      logger.error('invalidation: Failed to list subscribers: %s', e)
+      return
+
+    for entry in entries:
+      if not entry.endswith('.sock'):
+        continue
+
+      path = os.path.join(config.invalidation.directory, entry)
+
+      try:
+        for datagram in datagrams:
+          self.__socket.sendto(datagram, path)
+
+      except socket.error, e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+          # The subscriber has gone away
+          try:
+            os.unlink(path)
+
+          except OSError:
+            pass
+
+        elif e.errno in (errno.EAGAIN, errno.ENOBUFS):
+          logger.warning('invalidation: Subscriber %s is not receiving', entry)
+
+        else:
+          logger.error('invalidation: Failed to publish to %s: %s', entry, e)
+
+
+
+@export()
+class Subscriber(object):
+  ''' Receives the names of changed hosts published by other processes.
+
+      The socket is bound on first use. Without a
+      configured invalidation directory, nothing is ever received.
+  '''
+
+  def __init__(self):
+    self.__socket = None
+    self.__path = None
+
+
+  @require(config = 'ddserver.config:Config')
+  def open(self, config):
+    ''' Binds the socket of this process if not done yet.
+
+        Returns False if invalidation is not configured.
+    '''
+
+    if self.__socket is not None:
+      return True
+
+    if not config.invalidation.directory:
+      return False
+
+    path = os.path.join(config.invalidation.directory,
+                        'subscriber.%d.sock' % os.getpid())
+
+    # Remove the socket of a previous process with the same PID
+    try:
+      os.unlink(path)
+
+    except OSError, e:
+      if e.errno != errno.ENOENT:
+        raise
+
+    self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    self.__socket.setblocking(False)
+    self.__socket.bind(path)
+
+    os.chmod(path, config.invalidation.mode)
+
+    self.__path = path
+    atexit.register(self.close)
+
+    return True
+
+
+  def fileno(self):
+    ''' Returns the file descriptor of the socket or None. '''
+
+    if not self.open():
+      return None
+
+    return self.__socket.fileno()
+
+
+  def receive(self):
+    ''' Returns the names received since the last call without blocking. '''
+
+    if not self.open():
+      return []
+
+    names = []
+
+    while True:
+      try:
+        datagram = self.__socket.recv(DATAGRAM_SIZE)
+
+      except socket.error, e:
+        if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+          break
+
+        raise
+
+      names.extend(name
+                   for name
+                   in datagram.split('\n')
+                   if name)
+
+    return names
+
+
+  def close(self):
+    ''' Closes and removes the socket. '''
+
+    if self.__socket is None:
+      return
+
+    self.__socket.close()
+    self.__socket = None
+
+    try:
+      os.unlink(self.__path)
+
+    except OSError:
+      pass
@@ -0,0 +1,428 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import socket
+import struct
+import asyncore
+
+from ddserver.utils.deps import require, extend
+from ddserver.recursor.breaker import DatabaseUnavailable
+from ddserver.recursor.resolver import (zone,
+                                        warm,
+                                        resolve,
+                                        transfer,
+                                        changes,
+                                        answer_soa,
+                                        answer_a)
+from ddserver.nameserver import wire
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_nameserver(config_decl):
+  with config_decl.declare('nameserver') as s:
+    s('host',
+      conv=str,
+      default='0.0.0.0')
+    s('port',
+      conv=int,
+      default=53)
+
+
+@require(registry='ddserver.suffixes:SuffixRegistry')
+def answer(question,
+           registry):
+  """ Build the response to a question
+  """
+
+  if question.flags & wire.MASK_OPCODE:
+    return wire.Response(question, wire.RCODE_NOTIMP)
+
+  if question.qclass not in (wire.CLASS_IN, wire.CLASS_ANY):
+    return wire.Response(question, wire.RCODE_REFUSED, authoritative=False)
+
+  # We are not authoritative for names outside of our suffixes
+  suffix = registry.match(question.qname)
+  if suffix is None:
+    return wire.Response(question, wire.RCODE_REFUSED, authoritative=False)
+
+  qtype = wire.TYPES.get(question.qtype)
+
+  # IXFR requests over UDP are answered with the SOA record only, so the
+  # client can compare the serial and retry using TCP
+  if qtype == 'IXFR':
+    qtype = 'SOA'
+
+  # Resolvers cache negative answers, so names are not denied while the
+  # database is unavailable
+  try:
+    records = resolve(question.qname, qtype, strict=True) if qtype else []
+
+    if records:
+      response = wire.Response(question, wire.RCODE_NOERROR)
+
+      for record in records:
+        response.record(question.qname, record)
+
+      return response
+
+    # Distinguish between names without records of the queried type and names
+    # not existing at all
+    if resolve(question.qname, 'ANY', strict=True):
+      response = wire.Response(question, wire.RCODE_NOERROR)
+
+    else:
+      response = wire.Response(question, wire.RCODE_NXDOMAIN)
+
+  except DatabaseUnavailable:
+    return wire.Response(question, wire.RCODE_SERVFAIL, authoritative=False)
+
+  # Add the SOA of the suffix for negative caching
+  for record in resolve(suffix['name'], 'SOA'):
+    response.record(suffix['name'], record, section=2)
+
+  return response
+
+
+def full(suffix_id):
+  """ Iterates over all records of a suffix enclosed in its SOA record
+  """
+
+  soa = None
+
+  for name, record in transfer(suffix_id):
+    if soa is None:
+      soa = (name, record)
+
+    yield name, record
+
+  if soa is not None:
+    yield soa
+
+
+def incremental(name, serial, current, hosts):
+  """ Iterates over the records describing the changes since the serial
+
+      All changes are condensed into a single difference sequence.
+  """
+
+  soa = answer_soa(name, serial=current)[0]
+
+  yield name, soa
+
+  # The client is up to date
+  if not hosts:
+    return
+
+  yield name, answer_soa(name, serial=serial)[0]
+
+  for fqdn, old_address, _ in hosts:
+    for record in answer_a(old_address):
+      yield fqdn, record
+
+  yield name, soa
+
+  for fqdn, _, address in hosts:
+    for record in answer_a(address):
+      yield fqdn, record
+
+  yield name, soa
+
+
+@require(registry='ddserver.suffixes:SuffixRegistry')
+def answer_transfer(question,
+                    registry):
+  """ Iterates over the responses to a zone transfer request
+
+      IXFR requests are answered from the change log if it reaches back to
+      the serial of the client. Otherwise, the whole zone is sent as for AXFR
+      requests. The zone is split into multiple responses, which are built
+      while they are consumed.
+  """
+
+  suffix = registry.get(question.qname)
+  if suffix is None:
+    yield wire.Response(question, wire.RCODE_REFUSED, authoritative=False)
+    return
+
+  name = suffix['name'].lower().encode('utf8')
+
+  records = None
+
+  if question.qtype == wire.TYPE_IXFR and question.serial is not None:
+    current, hosts = changes(suffix['id'], question.serial)
+
+    if hosts is not None:
+      records = incremental(name, question.serial, current, hosts)
+
+  if records is None:
+    records = full(suffix['id'])
+
+  response = wire.Response(question, wire.RCODE_NOERROR)
+
+  for owner, record in records:
+    if len(response) >= wire.TRANSFER_SIZE:
+      yield response
+
+      response = wire.Response(question, wire.RCODE_NOERROR)
+
+    response.record(owner, record)
+
+  yield response
+
+
+@require(logger='ddserver.utils.logger:Logger')
+def stream(packet,
+           question,
+           logger):
+  """ Iterates over the packed responses to a zone transfer request
+
+      A failing transfer is aborted with an error response.
+  """
+
+  try:
+    for response in answer_transfer(question):
+      yield response.pack()
+
+  except Exception:
+    logger.exception('nameserver: Failed to transfer zone: %s', question)
+
+    error = wire.error(packet, wire.RCODE_SERVFAIL)
+    if error is not None:
+      yield error
+
+
+@require(logger='ddserver.utils.logger:Logger',
+         stats='ddserver.recursor.stats:Statistics')
+def handle(packet,
+           logger,
+           stats,
+           size=None):
+  """ Answer a query packet
+
+      Returns the response packets. Responses exceeding the given size are
+      replaced by an empty and truncated response, so the client retries
+      using TCP. Zone transfers are only answered if no size is given - the
+      responses are then returned as an iterator producing them one by one.
+      The result is empty if the packet can not be answered at all.
+  """
+
+  started = time.time()
+
+  try:
+    question = wire.parse_query(packet)
+
+  except wire.FormatError, e:
+    logger.debug('nameserver: Malformed query: %s', e)
+
+    # Responses and packets without a header are dropped silently
+    return filter(None, [wire.error(packet, wire.RCODE_FORMERR)])
+
+  logger.debug('nameserver: Received question: %s', question)
+
+  if size is None and question.qtype in (wire.TYPE_AXFR, wire.TYPE_IXFR):
+    stats.query(wire.TYPES[question.qtype], started)
+
+    return stream(packet, question)
+
+  try:
+    if question.qtype in (wire.TYPE_AXFR, wire.TYPE_IXFR):
+      if question.qtype == wire.TYPE_IXFR:
+        responses = [answer(question)]
+
+      else:
+        responses = [wire.Response(question, wire.RCODE_REFUSED)]
+
+    else:
+      responses = [answer(question)]
+
+  except Exception:
+    logger.exception('nameserver: Failed to answer question: %s', question)
+    return filter(None, [wire.error(packet, wire.RCODE_SERVFAIL)])
+
+  stats.query(wire.TYPES.get(question.qtype, str(question.qtype)), started)
+
+  if size is not None and len(responses[0]) > size:
+    return [wire.Response(question, wire.RCODE_NOERROR).pack(truncated=True)]
+
+  return [response.pack()
+          for response
+          in responses]
+
+
+class UDPServer(asyncore.dispatcher):
+  """ Answers queries received over UDP
+  """
+
+  def __init__(self, host, port):
+    asyncore.dispatcher.__init__(self)
+
+    self.create_socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.set_reuse_addr()
+    self.bind((host, port))
+
+
+  def handle_read(self):
+    packet, address = self.socket.recvfrom(65535)
+
+    for response in handle(packet, size=wire.UDP_SIZE):
+      self.socket.sendto(response, address)
+
+
+  def writable(self):
+    return False
+
+
+  @require(logger='ddserver.utils.logger:Logger')
+  def handle_error(self,
+                   logger):
+    # Keep on serving if a single datagram fails
+    logger.exception('nameserver: Failed to handle datagram')
+
+
+class TCPConnection(asyncore.dispatcher_with_send):
+  """ Answers queries received over a TCP connection
+
+      Each message is prefixed with its length as two byte integer. The
+      responses to a query are produced only as fast as the client reads
+      them, so a zone transfer neither blocks other clients nor is held in
+      memory at once. Further queries of the client are answered after the
+      transfer.
+  """
+
+  LENGTH = struct.Struct('!H')
+
+
+  def __init__(self, sock):
+    asyncore.dispatcher_with_send.__init__(self, sock)
+
+    self.__buffer = ''
+    self.__responses = None
+
+
+  def __pump(self):
+    """ Queue responses until enough data is waiting to be sent
+    """
+
+    while len(self.out_buffer) < wire.TRANSFER_SIZE:
+      if self.__responses is None:
+        if len(self.__buffer) < self.LENGTH.size:
+          return
+
+        length, = self.LENGTH.unpack_from(self.__buffer, 0)
+
+        if len(self.__buffer) < self.LENGTH.size + length:
+          return
+
+        packet = self.__buffer[self.LENGTH.size:self.LENGTH.size + length]
+        self.__buffer = self.__buffer[self.LENGTH.size + length:]
+
+        self.__responses = iter(handle(packet))
+
+      try:
+        response = next(self.__responses)
+
+      except StopIteration:
+        self.__responses = None
+        continue
+
+      self.send(self.LENGTH.pack(len(response)) + response)
+
+
+  def readable(self):
+    return self.__responses is None
+
+
+  def writable(self):
+    return (self.__responses is not None or
+            asyncore.dispatcher_with_send.writable(self))
+
+
+  def handle_read(self):
+    self.__buffer += self.recv(65535)
+
+    self.__pump()
+
+
+  def handle_write(self):
+    self.__pump()
+
+    self.initiate_send()
+
+
+  def initiate_send(self):
+    # Send as much as the socket takes instead of 512 bytes per call
+    sent = asyncore.dispatcher.send(self, self.out_buffer[:65536])
+    self.out_buffer = self.out_buffer[sent:]
+
+
+  @require(logger='ddserver.utils.logger:Logger')
+  def handle_error(self,
+                   logger):
+    logger.exception('nameserver: Failed to handle connection')
+
+    self.close()
+
+
+class TCPServer(asyncore.dispatcher):
+  """ Accepts TCP connections
+  """
+
+  def __init__(self, host, port):
+    asyncore.dispatcher.__init__(self)
+
+    self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.set_reuse_addr()
+    self.bind((host, port))
+    self.listen(128)
+
+
+  def handle_accept(self):
+    connection = self.accept()
+
+    if connection is not None:
+      TCPConnection(connection[0])
+
+
+@require(config='ddserver.config:Config',
+         logger='ddserver.utils.logger:Logger',
+         stats='ddserver.recursor.stats:Statistics')
+def main(config,
+         logger,
+         stats):
+  stats.install()
+
+  # Load the zone replica or map the snapshot before answering the first query
+  zone()
+
+  # Fetch the hosts queried most before the restart at once
+  warm()
+
+  UDPServer(config.nameserver.host, config.nameserver.port)
+  TCPServer(config.nameserver.host, config.nameserver.port)
+
+  logger.info('nameserver: Listening on %s:%d',
+              config.nameserver.host,
+              config.nameserver.port)
+
+  asyncore.loop(use_poll=True)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,317 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import socket
+import struct
+import collections
+
+
+# See RFC 1035 for the specification of the DNS message format
+
+
+HEADER = struct.Struct('!HHHHHH')  # id, flags, qd, an, ns, ar counts
+QUESTION = struct.Struct('!HH')    # type, class
+RECORD = struct.Struct('!HHIH')    # type, class, ttl, rdata length
+SOA = struct.Struct('!IIIII')      # serial, refresh, retry, expire, minimum
+
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+MASK_OPCODE = 0x7800
+
+CLASS_IN = 1
+CLASS_ANY = 255
+
+TYPE_SOA = 6
+TYPE_IXFR = 251
+TYPE_AXFR = 252
+
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_NOTIMP = 4
+RCODE_REFUSED = 5
+
+# Maximum size of a response sent over UDP
+UDP_SIZE = 512
+
+# Size after which a zone transfer is continued in the next message
+TRANSFER_SIZE = 16384
+
+# The record types known by name
+TYPES = {1: 'A',
+         6: 'SOA',
+         251: 'IXFR',
+         252: 'AXFR',
+         255: 'ANY'}
+
+CODES = {name: code
+         for code, name
+         in TYPES.iteritems()}
+
+
+class FormatError(Exception):
+  """ Raised if a message can not be parsed
+  """
+
+
+Question = collections.namedtuple('Question', ['id',
+                                               'flags',
+                                               'qname',
+                                               'qtype',
+                                               'qclass',
+                                               'serial'])
+
+
+def skip_name(packet, offset):
+  """ Returns the offset following the name at the given offset
+  """
+
+  while True:
+    if offset >= len(packet):
+      raise FormatError('Truncated name')
+
+    length = ord(packet[offset])
+
+    # A pointer terminates the name
+    if length & 0xC0 == 0xC0:
+      return offset + 2
+
+    offset += 1 + length
+
+    if length == 0:
+      return offset
+
+
+def parse_query(packet):
+  """ Parses the question of a query
+
+      Only queries containing exactly one question are supported. The serial
+      is taken from a SOA record in the authority section as sent with IXFR
+      queries. Other sections of the query are ignored.
+  """
+
+  if len(packet) < HEADER.size:
+    raise FormatError('Message too short')
+
+  id, flags, qdcount, _, nscount, _ = HEADER.unpack_from(packet, 0)
+
+  if flags & FLAG_QR:
+    raise FormatError('Message is not a query')
+
+  if qdcount != 1:
+    raise FormatError('Expected one question, got %d' % qdcount)
+
+  labels = []
+  offset = HEADER.size
+
+  while True:
+    if offset >= len(packet):
+      raise FormatError('Truncated name')
+
+    length = ord(packet[offset])
+    offset += 1
+
+    if length == 0:
+      break
+
+    if length > 63:
+      raise FormatError('Compressed or invalid name in question')
+
+    labels.append(packet[offset:offset + length])
+    offset += length
+
+  if offset + QUESTION.size > len(packet):
+    raise FormatError('Truncated question')
+
+  qtype, qclass = QUESTION.unpack_from(packet, offset)
+  offset += QUESTION.size
+
+  serial = None
+
+  if nscount > 0:
+    offset = skip_name(packet, offset)
+
+    if offset + RECORD.size > len(packet):
+      raise FormatError('Truncated record')
+
+    rtype, _, _, _ = RECORD.unpack_from(packet, offset)
+    offset += RECORD.size
+
+    if rtype == TYPE_SOA:
+      # Skip the primary name server and the mailbox
+      offset = skip_name(packet, offset)
+      offset = skip_name(packet, offset)
+
+      if offset + SOA.size > len(packet):
+        raise FormatError('Truncated SOA record')
+
+      serial, _, _, _, _ = SOA.unpack_from(packet, offset)
+
+  return Question(id=id,
+                  flags=flags,
+                  qname='.'.join(labels),
+                  qtype=qtype,
+                  qclass=qclass,
+                  serial=serial)
+
+
+class Response(object):
+  """ Builder for a response to a question
+
+      Names written to the response are compressed against all names written
+      before, starting with the name in the question.
+  """
+
+  def __init__(self, question, rcode, authoritative=True):
+    self.__question = question
+
+    self.__rcode = rcode
+    self.__authoritative = authoritative
+
+    self.__data = []
+    self.__length = HEADER.size
+    self.__names = {}
+
+    self.__counts = [1, 0, 0, 0]
+
+    self.__name(question.qname)
+    self.__write(QUESTION.pack(question.qtype, question.qclass))
+
+
+  def __write(self, data):
+    self.__data.append(data)
+    self.__length += len(data)
+
+
+  def __name(self, name):
+    if isinstance(name, unicode):
+      name = name.encode('utf8')
+
+    labels = name.split('.') if name else []
+
+    for i in range(len(labels)):
+      suffix = '.'.join(labels[i:]).lower()
+
+      # Point to the suffix if it was written before
+      offset = self.__names.get(suffix)
+      if offset is not None:
+        self.__write(struct.pack('!H', 0xC000 | offset))
+        return
+
+      # Offsets beyond 14 bits can not be referenced
+      if self.__length < 0x4000:
+        self.__names[suffix] = self.__length
+
+      self.__write(chr(len(labels[i])) + labels[i])
+
+    self.__write('\0')
+
+
+  def record(self, name, record, section=1):
+    """ Adds a record to the given section
+
+        @param name: the owner name of the record
+        @param record: the record as found by the resolver
+        @param section: 1 for answer, 2 for authority, 3 for additional
+    """
+
+    if record.qtype == 'A':
+      rdata = socket.inet_aton(record.content)
+
+    elif record.qtype == 'SOA':
+      mname, rname, serial, refresh, retry, expire, minimum = record.content.split(' ')
+
+      rdata = (encode_name(mname) +
+               encode_name(rname) +
+               SOA.pack(int(serial),
+                        int(refresh),
+                        int(retry),
+                        int(expire),
+                        int(minimum)))
+
+    else:
+      raise ValueError('Unsupported record type: %s' % record.qtype)
+
+    self.__name(name)
+    self.__write(RECORD.pack(CODES[record.qtype],
+                             CLASS_IN,
+                             int(record.ttl),
+                             len(rdata)))
+    self.__write(rdata)
+
+    self.__counts[section] += 1
+
+
+  def __len__(self):
+    return self.__length
+
+
+  def pack(self, truncated=False):
+    """ Returns the wire format of the response
+    """
+
+    flags = (FLAG_QR |
+             (self.__question.flags & (MASK_OPCODE | FLAG_RD)) |
+             self.__rcode)
+
+    if self.__authoritative:
+      flags |= FLAG_AA
+
+    if truncated:
+      flags |= FLAG_TC
+
+    return HEADER.pack(self.__question.id, flags, *self.__counts) + ''.join(self.__data)
+
+
+def encode_name(name):
+  """ Encodes a name without compression
+  """
+
+  if isinstance(name, unicode):
+    name = name.encode('utf8')
+
+  return ''.join(chr(len(label)) + label
+                 for label
+                 in name.split('.')
+                 if label) + '\0'
+
+
+def error(packet, rcode):
+  """ Builds an error response for a packet which could not be parsed
+
+      Returns None if the packet is too short to be answered or if it is a
+      response itself - answering responses would allow reflection attacks
+      and reply loops between servers.
+  """
+
+  if len(packet) < HEADER.size:
+    return None
+
+  id, flags, _, _, _, _ = HEADER.unpack_from(packet, 0)
+
+  if flags & FLAG_QR:
+    return None
+
+  return HEADER.pack(id,
+                     FLAG_QR | (flags & (MASK_OPCODE | FLAG_RD)) | rcode,
+                     0, 0, 0, 0)
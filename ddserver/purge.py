@@ -0,0 +1,167 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import time
+import shlex
+import socket
+import threading
+import subprocess
+
+from ddserver.utils.deps import extend, export, require
+
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_purge(config_decl):
+  with config_decl.declare('purge') as s:
+    s('command',
+      conv = str,
+      default = '')
+    s('socket',
+      conv = str,
+      default = '')
+    s('interval',
+      conv = int,
+      default = 5)
+    s('timeout',
+      conv = int,
+      default = 2)
+
+
+
+@export()
+class Purger(object):
+  ''' Purges changed names from the caches of PowerDNS.
+
+      The names are collected and purged by a background thread, either by
+      running the configured command once per name or by sending a purge
+      command per name to the control socket of PowerDNS. After each batch,
+      the thread waits for the configured interval, so a name changed many
+      times during the interval is purged only once.
+
+      As every change moves the serial of the suffix, the suffix of each name
+      is purged as well. Only the exact names are purged - purging a suffix
+      including all names below it would empty the cache of the whole zone.
+  '''
+
+  def __init__(self):
+    self.__condition = threading.Condition()
+    self.__pending = set()
+    self.__thread = None
+
+
+  @require(config = 'ddserver.config:Config')
+  def purge(self, names, config):
+    ''' Queues the given names and their suffixes for purging. '''
+
+    if not config.purge.command and not config.purge.socket:
+      return
+
+    names = set(name.lower().encode('utf8')
+                for name
+                in names)
+
+    # Host names consist of a single label followed by the suffix
+    suffixes = set(name.partition('.')[2]
+                   for name
+                   in names)
+
+    with self.__condition:
+      self.__pending.update(names)
+      self.__pending.update(suffix
+                            for suffix
+                            in suffixes
+                            if suffix)
+
+      if self.__thread is None:
+        self.__thread = threading.Thread(target = self.__run,
+                                         name = 'purge')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+      self.__condition.notify()
+
+
+  @require(config = 'ddserver.config:Config',
+           logger = 'ddserver.utils.logger:Logger')
+  def __run(self, config, logger):
+    while True:
+      with self.__condition:
+        while not self.__pending:
+          self.__condition.wait()
+
+        names, self.__pending = self.__pending, set()
+
+      logger.debug('purge: Purging %d names', len(names))
+
+      try:
+        if config.purge.socket:
+          self.__send(sorted(names))
+
+        else:
+          self.__execute(sorted(names))
+
+      except Exception:
+        logger.exception('purge: Failed to purge %d names', len(names))
+
+      # Names changed in the meantime are collected until the next batch
+      time.sleep(config.purge.interval)
+
+
+  @require(config = 'ddserver.config:Config',
+           logger = 'ddserver.utils.logger:Logger')
+  def __execute(self, names, config, logger):
+    with open(os.devnull, 'w') as devnull:
+      for name in names:
+        command = shlex.split(config.purge.command.format(name = name))
+
+        status = subprocess.call(command,
+                                 stdout = devnull,
+                                 stderr = devnull)
+
+        if status != 0:
+          logger.warning('purge: Purge command for %s failed with status %d',
+                         name, status)
+
+
+  @require(config = 'ddserver.config:Config',
+           logger = 'ddserver.utils.logger:Logger')
+  def __send(self, names, config, logger):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    try:
+      # PowerDNS replies to the address of the sender - an abstract address
+      # avoids leaving files behind
+      sock.bind('\0ddserver-purge.%d' % os.getpid())
+      sock.settimeout(config.purge.timeout)
+      sock.connect(config.purge.socket)
+
+      for name in names:
+        sock.send('purge %s' % name)
+
+        try:
+          sock.recv(1024)
+
+        except socket.timeout:
+          logger.warning('purge: No reply from %s while purging %s',
+                         config.purge.socket, name)
+
+    finally:
+      sock.close()
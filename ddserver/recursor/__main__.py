@@ -17,9 +17,13 @@ You should have received a copy of the GNU Affero General Public License
 along with ddserver. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import io
 import sys
+import time
 
-from ddserver.utils.deps import require, extend
+from ddserver.utils.deps import require
+from ddserver.recursor.breaker import DatabaseUnavailable
+from ddserver.recursor.resolver import zone, warm, resolve, transfer
 from ddserver.utils.txtprot import (LexerDeclaration,
                                     FormatterDeclaration,
                                     MessageDeclaration,
@@ -67,12 +71,11 @@ formatter = FormatterDeclaration(splitter='\t',
                                            MessageDeclaration('FAIL')))
 
 
-@extend('ddserver.config:ConfigDeclaration')
-def config_dns(config_decl):
-  with config_decl.declare('dns') as s:
-    s('ttl',
-      conv=int,
-      default=60)
+# Lines of the responses not yet written to PowerDNS
+output = []
+
+# Number of lines written at once while transferring a zone
+TRANSFER_LINES = 1024
 
 
 @require(logger='ddserver.utils.logger:Logger')
@@ -80,9 +83,17 @@ def receiver(logger):
   """ Receive and process messages from PowerDNS
   """
 
+  # Read the input through a large buffer instead of line by line
+  stdin = io.open(sys.stdin.fileno(), 'rb',
+                  buffering=65536,
+                  closefd=False)
+
   while True:
+    # Write the responses to the previous message before waiting for the next
+    flush()
+
     # Read a line
-    line = sys.stdin.readline()
+    line = stdin.readline()
     if not line:
       break
 
@@ -115,89 +126,77 @@ def send(cls,
   # Format the response
   line = formatter(message)
 
-  # Send line to standard output
-  sys.stdout.write(line + '\n')
-  sys.stdout.flush()
+  # Buffer the line until all responses to the current message are complete
+  output.append(line + '\n')
 
 
-@require(db='ddserver.db:Database')
-def answer_soa(query,
-               db):
-  """ Handle SOA records and respond with defined suffixes
+def flush():
+  """ Write all buffered responses to PowerDNS at once
   """
 
-  with db.cursor() as cur:
-    cur.execute('''
-      SELECT *
-      FROM `suffixes`
-      WHERE `name` = %(name)s
-    ''', {'name': query.qname})
-    suffix = cur.fetchone()
-
-    if suffix:
-      send(formatter.DATA, qname=query.qname,
-                           qclass=query.qclass,
-                           qtype='SOA',
-                           ttl=3600,
-                           id=query.id,
-                           content=' '.join(('ns.' + query.qname,
-                                             'webmaster.' + query.qname,
-                                             '0',
-                                             '86400',     # 24h
-                                             '7200',      # 2h
-                                             '3600000',   # 1000h
-                                             '172800')))  # 2d
-
-
-@require(db='ddserver.db:Database',
-         config='ddserver.config:Config')
-def answer_a(query,
-             db,
-             config):
-  """ Handle A records
-  """
+  if output:
+    sys.stdout.write(''.join(output))
+    sys.stdout.flush()
+
+    del output[:]
+
 
-  with db.cursor() as cur:
-    cur.execute('''
-        SELECT
-          `host`.`hostname` AS `hostname`,
-          `suffix`.`name` AS `suffix`,
-          `host`.`address` AS `address`
-        FROM `hosts` AS `host`
-        LEFT JOIN `suffixes` AS `suffix`
-          ON ( `suffix`.`id` = `host`.`suffix_id` )
-        WHERE `host`.`address` IS NOT NULL
-          AND CONCAT(`host`.`hostname`, '.', `suffix`.`name`) = %(name)s
-    ''', {'name': query.qname})
-    host = cur.fetchone()
-
-    if host:
-      send(formatter.DATA, qname=query.qname,
-                           qclass=query.qclass,
-                           qtype='A',
-                           ttl=config.dns.ttl,
-                           id=query.id,
-                           content=host['address'])
-
-
-def answer(query):
+@require(registry='ddserver.suffixes:SuffixRegistry')
+def answer(query,
+           registry):
   """ Determine query type and respond to it
   """
 
-  if query.qtype == 'SOA' or query.qtype == 'ANY':
-    answer_soa(query)
+  for record in resolve(query.qname, query.qtype):
+    id = query.id
 
-  if query.qtype == 'A' or query.qtype == 'ANY':
-    answer_a(query)
+    # PowerDNS refers to the zone by the ID given with the SOA record when
+    # requesting a transfer
+    if record.qtype == 'SOA':
+      suffix = registry.get(query.qname)
+      if suffix is not None:
+        id = suffix['id']
 
-  else:
-    # Ignore all other queries
-    pass
+    send(formatter.DATA, qname=query.qname,
+                         qclass=query.qclass,
+                         qtype=record.qtype,
+                         ttl=record.ttl,
+                         id=id,
+                         content=record.content)
 
 
+def axfr(request):
+  """ Respond with all records of the requested zone
+  """
+
+  for qname, record in transfer(request.id):
+    send(formatter.DATA, qname=qname,
+                         qclass='IN',
+                         qtype=record.qtype,
+                         ttl=record.ttl,
+                         id=request.id,
+                         content=record.content)
+
+    # Do not keep the whole zone in the output buffer
+    if len(output) >= TRANSFER_LINES:
+      flush()
+
+
+
+@require(logger='ddserver.utils.logger:Logger',
+         stats='ddserver.recursor.stats:Statistics',
+         hotset='ddserver.recursor.hotset:HotSet')
+def main(logger,
+         stats,
+         hotset):
+  stats.install()
+
+  # Load the zone replica or map the snapshot before answering the first query
+  zone()
+
+  # Fetch the hosts queried most before the restart at once
+  warm()
 
-@require(logger='ddserver.utils.logger:Logger')
-def main(logger):
   messages = receiver()
 
   # Handle messages until HELO was received
@@ -224,13 +223,25 @@ def main(logger):
       send(formatter.FAIL)
 
     elif message.tag == 'Q':
+      started = time.time()
+
       # Handle query
       answer(query=message)
 
       send(formatter.END)
 
+      stats.query(message.qtype, started)
+
     elif message.tag == 'AXFR':
-      # We do not support transfer by now
+      # Handle zone transfer
+      try:
+        axfr(request=message)
+
+      except DatabaseUnavailable, e:
+        logger.error('recursor: Failed to transfer zone: %s', e)
+        send(formatter.FAIL)
+        continue
+
       send(formatter.END)
 
     elif message.tag == 'PING':
@@ -241,6 +252,9 @@ def main(logger):
       logger.error('recursor: Unhandled message tag: %s', message)
       send(formatter.FAIL)
 
+  stats.dump()
+  hotset.save()
+
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,297 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import time
+import errno
+import Queue
+import select
+import threading
+import contextlib
+
+import MySQLdb
+
+from ddserver.utils.deps import extend, export, require
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_breaker(config_decl):
+  with config_decl.declare('recursor') as s:
+    s('db_timeout',
+      conv=int,
+      default=1)
+    s('db_deadline',
+      conv=float,
+      default=0.5)
+    s('breaker_failures',
+      conv=int,
+      default=3)
+    s('breaker_reset',
+      conv=int,
+      default=30)
+
+
+class DatabaseUnavailable(MySQLdb.OperationalError):
+  """ Raised if the database is not queried as the circuit breaker is open or
+      if the query failed
+
+      As this is an operational error, code keeping its data on operational
+      errors does so while the breaker is open.
+  """
+
+
+@export()
+class CircuitBreaker(object):
+  """ Stops querying the database after repeated failures.
+
+      The breaker opens if the configured number of queries failed in a row.
+      While the breaker is open, no queries are sent to the database. After
+      the reset time, a single query is let through - if it succeeds, the
+      breaker closes again, otherwise it stays open for another reset time.
+
+      Queries answering a DNS query are run in a worker thread, so the caller
+      can give up after the deadline while the query is still running. Until
+      that query has finished, further queries fail right away. A query given
+      up on counts as failure, even if it succeeds later on. As connections
+      are kept per thread, the worker opens a second connection to the
+      database besides the one of the main thread.
+  """
+
+  def __init__(self):
+    # Guards the counters, which are updated by the main and the worker
+    # thread
+    self.__lock = threading.RLock()
+
+    self.__failures = 0
+    self.__retry = 0
+
+    self.opened = 0
+
+    self.__jobs = None
+    self.__done = None
+    self.__worker = None
+    self.__running = None
+    self.__current = None
+
+
+  @property
+  @require(config='ddserver.config:Config')
+  def closed(self,
+             config):
+    """ Checks if the database may be queried
+    """
+
+    with self.__lock:
+      return (self.__failures < config.recursor.breaker_failures or
+              time.time() >= self.__retry)
+
+
+  @require(config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def failure(self,
+              error,
+              config,
+              logger):
+    """ Records a failed query
+    """
+
+    with self.__lock:
+      self.__failures += 1
+
+      if self.__failures >= config.recursor.breaker_failures:
+        if self.__failures == config.recursor.breaker_failures:
+          self.opened += 1
+
+        self.__retry = time.time() + config.recursor.breaker_reset
+
+        logger.error('recursor: Database unavailable, retrying in %ds: %s',
+                     config.recursor.breaker_reset,
+                     error)
+
+
+  @require(config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def success(self,
+              config,
+              logger):
+    """ Records a successful query
+    """
+
+    with self.__lock:
+      if self.__failures >= config.recursor.breaker_failures:
+        logger.warning('recursor: Database available again')
+
+      self.__failures = 0
+
+
+  @contextlib.contextmanager
+  def guard(self):
+    """ Guards the queries executed in the context
+
+        Raises DatabaseUnavailable without entering the context if the
+        breaker is open or if the database failed while in the context. The
+        outcome of a query given up on after the deadline is not recorded, as
+        it has been counted as failure already.
+    """
+
+    if not self.closed:
+      raise DatabaseUnavailable('Circuit breaker is open')
+
+    try:
+      yield
+
+    except DatabaseUnavailable:
+      raise
+
+    except MySQLdb.Error, e:
+      with self.__lock:
+        if not self.__abandoned():
+          self.failure(e)
+
+      raise DatabaseUnavailable(str(e))
+
+    with self.__lock:
+      if not self.__abandoned():
+        self.success()
+
+
+  def __abandoned(self):
+    """ Checks if the caller is the worker running a query given up on
+    """
+
+    return (threading.current_thread() is self.__worker and
+            self.__current['abandoned'])
+
+
+  def __work(self):
+    while True:
+      job = self.__jobs.get()
+
+      self.__current = job
+
+      try:
+        job['result'] = job['function']()
+
+      except Exception:
+        job['error'] = sys.exc_info()
+
+      os.write(self.__done[1], '.')
+
+
+  def __wait(self, timeout):
+    """ Waits for the running query to finish
+
+        Returns False if the query is still running after the timeout.
+    """
+
+    deadline = time.time() + timeout
+
+    while True:
+      try:
+        ready, _, _ = select.select([self.__done[0]], [], [],
+                                    max(0, deadline - time.time()))
+
+      except select.error, e:
+        # Interrupted by a signal
+        if e.args[0] == errno.EINTR:
+          continue
+
+        raise
+
+      if not ready:
+        return False
+
+      os.read(self.__done[0], 1)
+      return True
+
+
+  @require(config='ddserver.config:Config')
+  def run(self,
+          function,
+          config):
+    """ Runs a function querying the database with a deadline
+
+        The function is called without arguments in the worker thread.
+        Raises DatabaseUnavailable if the function does not return within the
+        configured deadline or if the query of an earlier call is still
+        running. Without a deadline, the function is called directly.
+    """
+
+    if config.recursor.db_deadline <= 0:
+      return function()
+
+    if not self.closed:
+      raise DatabaseUnavailable('Circuit breaker is open')
+
+    if self.__running is not None:
+      if not self.__wait(0):
+        raise DatabaseUnavailable('Previous query still running')
+
+      self.__running = None
+
+    if self.__jobs is None:
+      self.__jobs = Queue.Queue()
+      self.__done = os.pipe()
+
+      self.__worker = threading.Thread(target=self.__work,
+                                       name='database')
+      self.__worker.daemon = True
+      self.__worker.start()
+
+    job = {'function': function,
+           'result': None,
+           'error': None,
+           'abandoned': False}
+
+    self.__running = job
+    self.__jobs.put(job)
+
+    if not self.__wait(config.recursor.db_deadline):
+      # The worker must not record a success between the two
+      with self.__lock:
+        job['abandoned'] = True
+
+        self.failure('Query exceeded deadline of %gs' %
+                     config.recursor.db_deadline)
+
+      raise DatabaseUnavailable('Query exceeded deadline')
+
+    self.__running = None
+
+    if job['error'] is not None:
+      raise job['error'][0], job['error'][1], job['error'][2]
+
+    return job['result']
+
+
+@extend('ddserver.db:Database')
+@require(config='ddserver.config:Config',
+         breaker='ddserver.recursor.breaker:CircuitBreaker')
+def database_guard(db,
+                   config,
+                   breaker):
+  # The client library retries reads twice and writes once, so a stalled read
+  # takes up to three times the timeout. Per-query lookups are bounded by the
+  # deadline instead, see CircuitBreaker.run()
+  if config.recursor.db_timeout > 0:
+    db.timeout = config.recursor.db_timeout
+
+  # Every use of the database counts for the breaker
+  db.guard = breaker.guard
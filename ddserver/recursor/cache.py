@@ -0,0 +1,68 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from ddserver.utils.deps import extend, export
+from ddserver.utils.cache import LRUCache
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_recursor(config_decl):
+  with config_decl.declare('recursor') as s:
+    s('cache_size',
+      conv=int,
+      default=10000)
+    s('cache_memory',
+      conv=int,
+      default=16)
+    s('negative_cache_size',
+      conv=int,
+      default=10000)
+    s('negative_cache_ttl',
+      conv=int,
+      default=10)
+    s('serve_stale',
+      conv=int,
+      default=3600)
+
+
+@export(config='ddserver.config:Config')
+def AnswerCache(config):
+  """ The cache of answers found for (qname, qtype) pairs.
+
+      The entries expire after the configured DNS TTL. The size of the cache
+      is limited by the number of entries and by the memory in megabytes.
+      Expired entries are kept to be served while the database is unavailable.
+  """
+
+  return LRUCache(max_entries=config.recursor.cache_size,
+                  max_memory=config.recursor.cache_memory * 1024 * 1024,
+                  ttl=config.dns.ttl,
+                  grace=config.recursor.serve_stale)
+
+
+@export(config='ddserver.config:Config')
+def NegativeCache(config):
+  """ The cache of (qname, qtype) pairs without an answer.
+
+      The negative cache is separated from the answer cache, so a flood of
+      queries for non-existing names can not evict positive answers.
+  """
+
+  return LRUCache(max_entries=config.recursor.negative_cache_size,
+                  ttl=config.recursor.negative_cache_ttl)
@@ -0,0 +1,170 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import collections
+
+from ddserver.utils.deps import extend, export, require
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_hotset(config_decl):
+  with config_decl.declare('recursor') as s:
+    s('hotset',
+      conv=str,
+      default='')
+    s('hotset_size',
+      conv=int,
+      default=1000)
+    s('hotset_interval',
+      conv=int,
+      default=300)
+
+
+@export()
+class HotSet(object):
+  """ The most frequently queried names.
+
+      The names answered by the recursor are counted and the most frequent
+      ones are written to the hot set file periodically, one name per line.
+      After a restart, the caches are warmed up with the names from the file.
+
+      The counts are halved whenever the file is written and only the most
+      frequent names are kept, so the hot set follows the changing popularity
+      of the names and its size stays bounded. Between two writes, the
+      counted names are trimmed to the most frequent ones whenever there are
+      more than TRIM times the size of the hot set.
+
+      The file is shared by all recursor processes. The names counted by a
+      process are written first, followed by the names already in the file,
+      so a process which has counted few names, like one just started, does
+      not shrink the hot set.
+  """
+
+  # Factor of the hot set size above which the counted names are trimmed
+  TRIM = 10
+
+  @require(config='ddserver.config:Config')
+  def __init__(self,
+               config):
+    self.__counts = collections.Counter()
+    self.__next_save = time.time() + config.recursor.hotset_interval
+
+
+  @require(config='ddserver.config:Config')
+  def count(self,
+            qname,
+            config):
+    """ Counts a query for the given name
+    """
+
+    if not config.recursor.hotset:
+      return
+
+    self.__counts[qname.lower()] += 1
+
+    if len(self.__counts) > self.TRIM * config.recursor.hotset_size:
+      self.__counts = collections.Counter(
+          dict(self.__counts.most_common(config.recursor.hotset_size)))
+
+    if time.time() >= self.__next_save:
+      self.save()
+
+
+  @require(config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def save(self,
+           config,
+           logger):
+    """ Writes the most frequent names to the hot set file
+    """
+
+    if not config.recursor.hotset:
+      return
+
+    self.__next_save = time.time() + config.recursor.hotset_interval
+
+    common = self.__counts.most_common(config.recursor.hotset_size)
+
+    # Nothing has been queried since the last write
+    if not common:
+      return
+
+    self.__counts = collections.Counter({name: count // 2
+                                         for name, count
+                                         in common
+                                         if count > 1})
+
+    hot = [name
+           for name, _
+           in common]
+
+    # Fill up with the names written before by this or other processes
+    try:
+      known = set(hot)
+      hot += [name
+              for name
+              in self.__read(config.recursor.hotset)
+              if name not in known]
+
+    except IOError:
+      pass
+
+    temp = '%s.%d' % (config.recursor.hotset, os.getpid())
+
+    try:
+      with open(temp, 'wb') as f:
+        f.write(''.join(name + '\n'
+                        for name
+                        in hot[:config.recursor.hotset_size]))
+
+      os.rename(temp, config.recursor.hotset)
+
+    except (IOError, OSError), e:
+      logger.error('recursor: Failed to write hot set: %s', e)
+
+
+  @require(config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def load(self,
+           config,
+           logger):
+    """ Returns the names from the hot set file
+    """
+
+    if not config.recursor.hotset:
+      return []
+
+    try:
+      names = self.__read(config.recursor.hotset)
+
+    except IOError, e:
+      logger.info('recursor: No hot set loaded: %s', e)
+      return []
+
+    return names[:config.recursor.hotset_size]
+
+
+  def __read(self, path):
+    with open(path, 'rb') as f:
+      return [line.strip()
+              for line
+              in f
+              if line.strip()]
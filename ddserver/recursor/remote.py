@@ -0,0 +1,252 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import errno
+import socket
+import asyncore
+
+from ddserver.utils.deps import require, extend
+from ddserver.recursor.resolver import zone, warm, resolve, transfer
+
+
+# See http://doc.powerdns.com/md/authoritative/backend-remote/
+# for further protocol specification
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_remote(config_decl):
+  with config_decl.declare('recursor') as s:
+    s('remote_socket',
+      conv=str,
+      default='/var/run/ddserver/remote.sock')
+    s('remote_socket_mode',
+      conv=lambda v: int(v, 8),
+      default=0660)
+
+
+@require(logger='ddserver.utils.logger:Logger',
+         registry='ddserver.suffixes:SuffixRegistry',
+         stats='ddserver.recursor.stats:Statistics')
+def handle(request,
+           logger,
+           registry,
+           stats):
+  """ Answer a request of PowerDNS
+
+      Queries and zone transfers are answered using the resolver. All other
+      methods are reported as not supported.
+  """
+
+  method = request.get('method')
+  parameters = request.get('parameters') or {}
+
+  if method == 'initialize':
+    return True
+
+  if method == 'lookup':
+    started = time.time()
+
+    # Names may be given with a trailing dot
+    qname = parameters['qname'].rstrip('.').encode('utf8')
+    qtype = parameters['qtype'].encode('utf8')
+
+    result = [{'qname': qname,
+               'qtype': record.qtype,
+               'ttl': record.ttl,
+               'content': record.content}
+              for record
+              in resolve(qname, qtype)]
+
+    stats.query(qtype, started)
+
+    return result
+
+  if method == 'list':
+    suffix = registry.get(parameters['zonename'].rstrip('.'))
+    if suffix is None:
+      return False
+
+    # The protocol requires the whole zone in a single response
+    return [{'qname': qname,
+             'qtype': record.qtype,
+             'ttl': record.ttl,
+             'content': record.content}
+            for qname, record
+            in transfer(suffix['id'])]
+
+  logger.debug('recursor: Unsupported method: %s', method)
+  return False
+
+
+class RemoteConnection(asyncore.dispatcher_with_send):
+  """ A connection of a PowerDNS backend thread
+
+      Each request is a JSON object. As PowerDNS does not delimit the
+      requests, they are decoded from the start of the received data as soon
+      as they are complete. PowerDNS writes each request on a single line, so
+      data which can not be decoded although a line is complete is dropped up
+      to the end of the line and answered with a failure.
+  """
+
+  decoder = json.JSONDecoder()
+
+  # Maximum size of a single request
+  MAX_REQUEST = 65536
+
+
+  def __init__(self, sock):
+    asyncore.dispatcher_with_send.__init__(self, sock)
+
+    self.__buffer = ''
+
+
+  @require(logger='ddserver.utils.logger:Logger')
+  def handle_read(self,
+                  logger):
+    self.__buffer += self.recv(65535)
+
+    responses = []
+
+    while True:
+      data = self.__buffer.lstrip()
+      if not data:
+        break
+
+      try:
+        request, end = self.decoder.raw_decode(data)
+
+      except ValueError:
+        line, newline, rest = data.partition('\n')
+
+        if not newline:
+          # Wait for the rest of the request
+          self.__buffer = data
+          break
+
+        logger.warning('recursor: Dropping malformed request: %r', line)
+
+        self.__buffer = rest
+
+        responses.append(json.dumps({'result': False}) + '\n')
+        continue
+
+      self.__buffer = data[end:]
+
+      logger.debug('recursor: Received request: %s', request)
+
+      try:
+        result = handle(request)
+
+      except Exception:
+        logger.exception('recursor: Failed to handle request: %s', request)
+        result = False
+
+      responses.append(json.dumps({'result': result}) + '\n')
+
+    # Answer all complete requests at once
+    if responses:
+      self.send(''.join(responses))
+
+    if len(self.__buffer) > self.MAX_REQUEST:
+      logger.warning('recursor: Request exceeds %d bytes, closing connection',
+                     self.MAX_REQUEST)
+      self.close()
+
+
+  @require(logger='ddserver.utils.logger:Logger')
+  def handle_close(self,
+                   logger):
+    logger.debug('recursor: Connection closed')
+
+    self.close()
+
+
+class RemoteServer(asyncore.dispatcher):
+  """ Accepts the connections of PowerDNS on a UNIX socket
+  """
+
+  def __init__(self, path, mode):
+    asyncore.dispatcher.__init__(self)
+
+    # Remove the socket of a previous run
+    try:
+      os.unlink(path)
+
+    except OSError, e:
+      if e.errno != errno.ENOENT:
+        raise
+
+    self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.bind(path)
+    self.listen(128)
+
+    os.chmod(path, mode)
+
+
+  def handle_accept(self):
+    connection = self.accept()
+
+    if connection is not None:
+      RemoteConnection(connection[0])
+
+
+@require(config='ddserver.config:Config',
+         logger='ddserver.utils.logger:Logger',
+         stats='ddserver.recursor.stats:Statistics',
+         hotset='ddserver.recursor.hotset:HotSet')
+def main(config,
+         logger,
+         stats,
+         hotset):
+  """ Serves all backend threads of PowerDNS from a single process
+
+      All connections share the caches, the in-memory zone and the database
+      connection. Requests are answered one after another by a single thread,
+      so a query waiting for the database delays the queries of all other
+      connections, and a zone listing blocks all queries until the whole zone
+      has been read. Use an in-memory zone or several processes on separate
+      sockets if this is a limitation.
+  """
+
+  stats.install()
+
+  # Load the zone replica or map the snapshot before answering the first query
+  zone()
+
+  # Fetch the hosts queried most before the restart at once
+  warm()
+
+  RemoteServer(config.recursor.remote_socket,
+               config.recursor.remote_socket_mode)
+
+  logger.info('recursor: Listening on %s', config.recursor.remote_socket)
+
+  try:
+    asyncore.loop(use_poll=True)
+
+  finally:
+    stats.dump()
+    hotset.save()
+
+
+if __name__ == '__main__':
+  main()
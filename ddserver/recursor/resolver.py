@@ -0,0 +1,550 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import collections
+
+from ddserver.utils.deps import require, extend
+from ddserver.changes import serial_before
+from ddserver.recursor.zone import unpack_address
+from ddserver.recursor.breaker import DatabaseUnavailable
+
+
+# A record found for a query
+Record = collections.namedtuple('Record', ['qtype',
+                                           'ttl',
+                                           'content'])
+
+# The TTL of stale records served while the database is unavailable, see
+# RFC 8767
+STALE_TTL = 30
+
+# The number of hosts fetched from the database at once during zone transfers
+TRANSFER_BATCH = 1000
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_dns(config_decl):
+  with config_decl.declare('dns') as s:
+    s('ttl',
+      conv=int,
+      default=60)
+    s('ttl_adaptive',
+      conv=lambda v: v.strip().lower() in ('1', 'yes', 'true', 'on'),
+      default=False)
+    s('ttl_min',
+      conv=int,
+      default=60)
+    s('ttl_max',
+      conv=int,
+      default=3600)
+    s('ttl_factor',
+      conv=float,
+      default=0.1)
+
+
+@require(config='ddserver.config:Config',
+         replica='ddserver.recursor.zone:ZoneReplica',
+         snapshot='ddserver.recursor.snapshot:ZoneSnapshot')
+def zone(config,
+         replica,
+         snapshot):
+  """ Returns the in-memory zone to answer from or None if queries must be
+      answered from the database
+  """
+
+  if config.recursor.snapshot:
+    snapshot.refresh()
+
+    # Fall back to the database until a snapshot has been written
+    if snapshot.mapped:
+      return snapshot
+
+  elif config.recursor.replica:
+    replica.refresh()
+
+    return replica
+
+  return None
+
+
+@require(db='ddserver.db:Database',
+         registry='ddserver.suffixes:SuffixRegistry',
+         breaker='ddserver.recursor.breaker:CircuitBreaker',
+         stats='ddserver.recursor.stats:Statistics')
+def lookup(qname,
+           memory,
+           db,
+           registry,
+           breaker,
+           stats):
+  """ Find the suffix and the host address for a name
+
+      Both are looked up in the in-memory zone if given. Otherwise, the suffix
+      is taken from the suffix registry and the address is fetched from the
+      database if the name is a host name below a suffix. The returned tuple
+      contains the name of the suffix, the address of the host and the time
+      the host was updated where each of them is None if it does not exist.
+
+      Raises DatabaseUnavailable if the database is required but can not be
+      queried within the deadline.
+  """
+
+  if memory is not None:
+    suffix = qname.lower() if memory.is_suffix(qname) else None
+    host = memory.host(qname)
+
+    if host is None:
+      return suffix, None, None
+
+    return (suffix,) + host
+
+  suffix = registry.get(qname)
+  if suffix is not None:
+    suffix = suffix['name']
+
+  # Host names consist of a single label followed by the suffix
+  if qname.partition('.')[2] not in registry:
+    return suffix, None, None
+
+  started = time.time()
+
+  def fetch():
+    with db.cursor() as cur:
+      cur.execute('''
+          SELECT
+            `host`.`address` AS `address`,
+            UNIX_TIMESTAMP(`host`.`updated`) AS `updated`
+          FROM `hosts` AS `host`
+          WHERE `host`.`fqdn` = %(name)s
+            AND `host`.`address` IS NOT NULL
+      ''', {'name': qname})
+      return cur.fetchone()
+
+  # The query must not hold up the answer longer than the deadline
+  host = breaker.run(fetch)
+
+  stats.database(started)
+
+  if host is None:
+    return suffix, None, None
+
+  return suffix, host['address'], host['updated']
+
+
+@require(config='ddserver.config:Config',
+         db='ddserver.db:Database',
+         cache='ddserver.recursor.cache:AnswerCache',
+         registry='ddserver.suffixes:SuffixRegistry',
+         hotset='ddserver.recursor.hotset:HotSet',
+         logger='ddserver.utils.logger:Logger')
+def warm(config,
+         db,
+         cache,
+         registry,
+         hotset,
+         logger):
+  """ Fill the answer cache with the records of the hosts in the hot set
+
+      The records are cached for A and ANY queries, as the latter are sent by
+      PowerDNS for most lookups. All hosts are fetched from the database using
+      a single query. Nothing is done if the hot set is empty or an in-memory
+      zone is used.
+  """
+
+  if zone() is not None:
+    return
+
+  names = hotset.load()
+  if not names:
+    return
+
+  try:
+    with db.cursor() as cur:
+      cur.execute('''
+          SELECT
+            `host`.`fqdn` AS `fqdn`,
+            `host`.`address` AS `address`,
+            UNIX_TIMESTAMP(`host`.`updated`) AS `updated`
+          FROM `hosts` AS `host`
+          WHERE `host`.`fqdn` IN (%s)
+            AND `host`.`address` IS NOT NULL
+      ''' % ', '.join('%%(name%d)s' % i
+                      for i
+                      in range(len(names))),
+                  {'name%d' % i: name
+                   for i, name
+                   in enumerate(names)})
+      hosts = cur.fetchall()
+
+  except DatabaseUnavailable, e:
+    logger.error('recursor: Failed to warm up cache: %s', e)
+    return
+
+  for host in hosts:
+    name = host['fqdn'].lower()
+    records = answer_a(host['address'], host['updated'])
+
+    cache.put((name, 'A'), records,
+              ttl=min(config.dns.ttl, records[0].ttl))
+
+    # Build the answer to ANY queries the same way as resolve()
+    suffix = registry.get(name)
+    if suffix is not None:
+      suffix = suffix['name']
+
+    cache.put((name, 'ANY'), answer_soa(suffix) + records,
+              ttl=min(config.dns.ttl, records[0].ttl))
+
+  logger.info('recursor: Warmed up cache with %d of %d hot names',
+              len(hosts),
+              len(names))
+
+
+@require(registry='ddserver.suffixes:SuffixRegistry')
+def answer_soa(suffix,
+               registry,
+               serial=None):
+  """ Build SOA records for defined suffixes
+
+      The serial is taken from the suffix registry if not given.
+  """
+
+  if suffix is None:
+    return []
+
+  if serial is None:
+    entry = registry.get(suffix)
+    serial = entry['serial'] if entry is not None else 0
+
+  return [Record(qtype='SOA',
+                 ttl=3600,
+                 content=' '.join(('ns.' + suffix,
+                                   'webmaster.' + suffix,
+                                   str(serial),
+                                   '86400',     # 24h
+                                   '7200',      # 2h
+                                   '3600000',   # 1000h
+                                   '172800')))]  # 2d
+
+
+@require(config='ddserver.config:Config')
+def ttl(updated,
+        config):
+  """ Determine the TTL of the A record of a host
+
+      In adaptive mode, the TTL grows with the time since the host was last
+      updated, bounded by the minimum and maximum TTL. Right after an update,
+      the minimum TTL is used.
+  """
+
+  if not config.dns.ttl_adaptive or updated is None:
+    return config.dns.ttl
+
+  age = max(0, time.time() - updated)
+
+  return int(min(config.dns.ttl_max,
+                 max(config.dns.ttl_min,
+                     age * config.dns.ttl_factor)))
+
+
+def answer_a(address,
+             updated=None):
+  """ Build A records
+
+      Without the update time of the host, the fixed TTL is used.
+  """
+
+  if address is None:
+    return []
+
+  return [Record(qtype='A',
+                 ttl=ttl(updated),
+                 content=address)]
+
+
+@require(cache='ddserver.recursor.cache:AnswerCache',
+         negative_cache='ddserver.recursor.cache:NegativeCache',
+         replica='ddserver.recursor.zone:ZoneReplica',
+         subscriber='ddserver.invalidation:Subscriber')
+def invalidate(cache,
+               negative_cache,
+               replica,
+               subscriber):
+  """ Evict the names of hosts changed by other processes from the caches
+
+      The zone replica is synchronized on the next refresh.
+  """
+
+  names = subscriber.receive()
+  if not names:
+    return
+
+  for name in names:
+    for qtype in ('SOA', 'A', 'ANY'):
+      cache.discard((name, qtype))
+      negative_cache.discard((name, qtype))
+
+  replica.invalidate()
+
+
+@require(config='ddserver.config:Config',
+         cache='ddserver.recursor.cache:AnswerCache',
+         negative_cache='ddserver.recursor.cache:NegativeCache',
+         registry='ddserver.suffixes:SuffixRegistry',
+         hotset='ddserver.recursor.hotset:HotSet')
+def resolve(qname,
+            qtype,
+            config,
+            cache,
+            negative_cache,
+            registry,
+            hotset,
+            strict=False):
+  """ Find the records for a query
+
+      Supported query types are A, SOA and ANY. The returned list is empty if
+      the query has no answer. While the database is unavailable, expired
+      records are returned instead. If there are none, the list is empty as
+      well, unless strict is set - then DatabaseUnavailable is raised, so the
+      caller can tell the failure from a name without records.
+  """
+
+  if qtype not in ('SOA', 'A', 'ANY'):
+    # Ignore all other queries
+    return []
+
+  # Apply the changes published since the last query
+  invalidate()
+
+  memory = zone()
+
+  # Names outside of all suffixes are rejected before touching the caches
+  if memory is None and registry.match(qname) is None:
+    return []
+
+  # Names are case insensitive
+  key = (qname.lower(), qtype)
+
+  # Try to answer the query from the cache
+  records = cache.get(key)
+
+  if records is None:
+    # Check if the query is known to have no answer
+    if negative_cache.get(key):
+      return []
+
+    # Resolve the suffix and the address at once, so ANY queries do not
+    # require multiple lookups
+    try:
+      suffix, address, updated = lookup(qname, memory)
+
+    except DatabaseUnavailable:
+      # Answer with the expired records if any instead of waiting for the
+      # database
+      records = [record._replace(ttl=min(record.ttl, STALE_TTL))
+                 for record
+                 in cache.get(key, default=[], stale=True)]
+
+      if not records and strict:
+        raise
+
+      return records
+
+    records = []
+
+    if qtype == 'SOA' or qtype == 'ANY':
+      records += answer_soa(suffix)
+
+    if qtype == 'A' or qtype == 'ANY':
+      records += answer_a(address, updated)
+
+    if records:
+      # Do not keep records in the cache longer than their TTL
+      cache.put(key, records, ttl=min([config.dns.ttl] +
+                                      [record.ttl
+                                       for record
+                                       in records]))
+
+    else:
+      negative_cache.put(key, True)
+
+  if records:
+    hotset.count(qname)
+
+  return records
+
+
+@require(db='ddserver.db:Database',
+         registry='ddserver.suffixes:SuffixRegistry')
+def transfer(suffix_id,
+             db,
+             registry):
+  """ Iterates over all (name, record) pairs of the suffix with the given ID
+
+      The SOA record of the suffix comes first, followed by the A records of
+      all hosts. The hosts are taken from the in-memory zone if available.
+      Otherwise, they are fetched from the database in batches of
+      TRANSFER_BATCH hosts, so large zones are never held in memory at once
+      and the connection can be used for other queries while the records are
+      consumed. Nothing is returned if the suffix does not exist.
+  """
+
+  suffix = registry.by_id(suffix_id)
+  if suffix is None:
+    return
+
+  name = suffix['name'].lower().encode('utf8')
+
+  memory = zone()
+
+  if memory is not None:
+    # Collect the hosts first, as the in-memory zone may be replaced while the
+    # records are consumed
+    hosts = [(fqdn, address)
+             for fqdn, address, _
+             in memory.hosts()
+             if fqdn.partition('.')[2] == name]
+
+    for record in answer_soa(name):
+      yield name, record
+
+    # Host names consist of a single label followed by the suffix
+    for fqdn, address in hosts:
+      for record in answer_a(unpack_address(address)):
+        yield fqdn, record
+
+    return
+
+  # The serial is read before the hosts, so hosts changed during the transfer
+  # are sent again by the next incremental transfer
+  with db.cursor() as cur:
+    cur.execute('''
+        SELECT `serial`
+        FROM `suffixes`
+        WHERE `id` = %(suffix_id)s
+    ''', {'suffix_id': suffix_id})
+    serial = cur.fetchone()
+
+  if serial is None:
+    return
+
+  for record in answer_soa(name, serial=serial['serial']):
+    yield name, record
+
+  last = 0
+
+  while True:
+    with db.cursor() as cur:
+      cur.execute('''
+          SELECT
+            `host`.`id` AS `id`,
+            `host`.`fqdn` AS `fqdn`,
+            `host`.`address` AS `address`
+          FROM `hosts` AS `host`
+          WHERE `host`.`suffix_id` = %(suffix_id)s
+            AND `host`.`id` > %(last)s
+            AND `host`.`address` IS NOT NULL
+          ORDER BY `host`.`id`
+          LIMIT %(limit)s
+      ''', {'suffix_id': suffix_id,
+            'last': last,
+            'limit': TRANSFER_BATCH})
+      hosts = cur.fetchall()
+
+    for host in hosts:
+      for record in answer_a(host['address']):
+        yield host['fqdn'], record
+
+    if len(hosts) < TRANSFER_BATCH:
+      break
+
+    last = hosts[-1]['id']
+
+
+@require(db='ddserver.db:Database')
+def changes(suffix_id,
+            serial,
+            db):
+  """ Find the hosts of a suffix changed since the given serial
+
+      Returns the current serial of the suffix and a list of (name, old
+      address, new address) tuples, where each host changed multiple times is
+      contained once. Hosts which have been added or deleted have no old or no
+      new address. If the change log does not reach back to the given serial,
+      None is returned instead of the list. Both are None if the suffix does
+      not exist.
+  """
+
+  with db.cursor() as cur:
+    cur.execute('''
+        SELECT `serial`
+        FROM `suffixes`
+        WHERE `id` = %(suffix_id)s
+    ''', {'suffix_id': suffix_id})
+    suffix = cur.fetchone()
+
+    if suffix is None:
+      return None, None
+
+    current = suffix['serial']
+
+    if not serial_before(serial, current):
+      return current, []
+
+    # Serials are IDs of changes - the change log is complete since the given
+    # serial if it still contains the change
+    cur.execute('''
+        SELECT `id`
+        FROM `changelog`
+        WHERE `suffix_id` = %(suffix_id)s
+          AND `id` = %(serial)s
+    ''', {'suffix_id': suffix_id,
+          'serial': serial})
+
+    if cur.fetchone() is None:
+      return current, None
+
+    cur.execute('''
+        SELECT `fqdn`, `old_address`, `address`
+        FROM `changelog`
+        WHERE `suffix_id` = %(suffix_id)s
+          AND `id` > %(serial)s
+          AND `id` <= %(current)s
+        ORDER BY `id`
+    ''', {'suffix_id': suffix_id,
+          'serial': serial,
+          'current': current})
+
+    # Condense multiple changes of a host into one
+    hosts = collections.OrderedDict()
+
+    for change in cur:
+      fqdn = change['fqdn'].lower()
+
+      if fqdn in hosts:
+        hosts[fqdn][2] = change['address']
+
+      else:
+        hosts[fqdn] = [fqdn, change['old_address'], change['address']]
+
+  return current, [tuple(host)
+                   for host
+                   in hosts.itervalues()
+                   if host[1] != host[2]]
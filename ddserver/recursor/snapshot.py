@@ -0,0 +1,343 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import mmap
+import time
+import zlib
+import select
+import array
+import struct
+
+from ddserver.utils.deps import extend, export, require
+from ddserver.recursor.zone import unpack_address
+
+
+# The snapshot file consists of a header, followed by the entries sorted by
+# name and a hash table of the entry offsets. Each entry consists of a kind,
+# the length of the name, the packed address, the update time and the name
+# itself. The hash
+# table uses open addressing with linear probing over the CRC32 of the names
+# where an offset of zero marks an empty bucket.
+#
+# All numbers are stored in native byte order, as snapshots are written and
+# read on the same machine.
+
+MAGIC = 'DDZS'
+VERSION = 2
+
+HEADER = struct.Struct('=4sIIII')  # magic, version, entries, buckets, table
+ENTRY = struct.Struct('=BHII')     # kind, length, address, updated
+BUCKET = struct.Struct('=I')       # offset
+
+KIND_HOST = 1
+KIND_SUFFIX = 2
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_snapshot(config_decl):
+  with config_decl.declare('recursor') as s:
+    s('snapshot',
+      conv=str,
+      default='')
+    s('snapshot_interval',
+      conv=int,
+      default=10)
+    s('snapshot_check',
+      conv=int,
+      default=1)
+
+
+def write(path, hosts, suffixes):
+  """ Writes a snapshot file
+
+      The file is written to a temporary file first, which is renamed to the
+      given path afterwards. Readers having the old file mapped keep on using
+      it until they notice the new file.
+
+      @param hosts: an iterable of (name, packed address, update time) tuples
+      @param suffixes: an iterable of suffix names
+  """
+
+  entries = [(name.lower(), KIND_HOST, address, updated)
+             for name, address, updated
+             in hosts]
+  entries += [(name.lower(), KIND_SUFFIX, 0, 0)
+              for name
+              in suffixes]
+
+  # Names longer than a DNS name can not be queried
+  entries = sorted(entry
+                   for entry
+                   in entries
+                   if len(entry[0]) <= 255)
+
+  buckets = 8
+  while buckets < len(entries) * 2:
+    buckets *= 2
+
+  table = array.array('I', [0]) * buckets
+
+  data = []
+  offset = HEADER.size
+
+  for name, kind, address, updated in entries:
+    bucket = zlib.crc32(name) & (buckets - 1)
+    while table[bucket] != 0:
+      bucket = (bucket + 1) & (buckets - 1)
+
+    table[bucket] = offset
+
+    data.append(ENTRY.pack(kind, len(name), address, updated))
+    data.append(name)
+
+    offset += ENTRY.size + len(name)
+
+  temp = '%s.%d' % (path, os.getpid())
+
+  with open(temp, 'wb') as f:
+    f.write(HEADER.pack(MAGIC, VERSION, len(entries), buckets, offset))
+    f.write(''.join(data))
+    f.write(table.tostring())
+
+  os.rename(temp, path)
+
+
+class Snapshot(object):
+  """ A memory-mapped snapshot file
+  """
+
+  def __init__(self, path):
+    with open(path, 'rb') as f:
+      self.__stat = os.fstat(f.fileno())
+      self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, self.__entries, self.__buckets, self.__table = HEADER.unpack_from(self.__map, 0)
+
+    if magic != MAGIC or version != VERSION:
+      self.__map.close()
+      raise ValueError('Invalid snapshot file: %s' % path)
+
+
+  def lookup(self, name):
+    """ Returns the kind, packed address and update time for the given name
+        or None
+    """
+
+    name = name.lower()
+
+    mask = self.__buckets - 1
+    bucket = zlib.crc32(name) & mask
+
+    while True:
+      offset, = BUCKET.unpack_from(self.__map, self.__table + bucket * BUCKET.size)
+
+      if offset == 0:
+        return None
+
+      kind, length, address, updated = ENTRY.unpack_from(self.__map, offset)
+
+      if (length == len(name) and
+          self.__map[offset + ENTRY.size:offset + ENTRY.size + length] == name):
+        return kind, address, updated
+
+      bucket = (bucket + 1) & mask
+
+
+  def entries(self):
+    """ Iterates over all (name, kind, packed address, update time) entries
+        sorted by name
+    """
+
+    offset = HEADER.size
+
+    for _ in xrange(self.__entries):
+      kind, length, address, updated = ENTRY.unpack_from(self.__map, offset)
+      offset += ENTRY.size
+
+      yield self.__map[offset:offset + length], kind, address, updated
+      offset += length
+
+
+  def is_current(self, stat):
+    """ Checks if the mapped file is the one described by the given stat
+    """
+
+    return (self.__stat.st_ino == stat.st_ino and
+            self.__stat.st_mtime == stat.st_mtime)
+
+
+  def close(self):
+    self.__map.close()
+
+
+  def __len__(self):
+    return self.__entries
+
+
+@export()
+class ZoneSnapshot(object):
+  """ The zone snapshot shared between all recursor processes.
+
+      The snapshot file is checked for replacement every few seconds and
+      re-mapped if a new snapshot was written.
+  """
+
+  def __init__(self):
+    self.__snapshot = None
+    self.__next_check = 0
+
+
+  @require(config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def refresh(self,
+              config,
+              logger):
+    """ Maps the current snapshot file if it has been replaced
+    """
+
+    now = time.time()
+    if now < self.__next_check:
+      return
+
+    self.__next_check = now + config.recursor.snapshot_check
+
+    try:
+      stat = os.stat(config.recursor.snapshot)
+
+    except OSError:
+      if self.__snapshot is None:
+        logger.error('recursor: Snapshot not found: %s', config.recursor.snapshot)
+
+      return
+
+    if self.__snapshot is not None and self.__snapshot.is_current(stat):
+      return
+
+    try:
+      snapshot = Snapshot(config.recursor.snapshot)
+
+    except ValueError, e:
+      # Snapshots written by another version are ignored until replaced
+      logger.error('recursor: %s', e)
+      return
+
+    if self.__snapshot is not None:
+      self.__snapshot.close()
+
+    self.__snapshot = snapshot
+
+    logger.info('recursor: Mapped snapshot with %d entries', len(snapshot))
+
+
+  @property
+  def mapped(self):
+    """ Checks if a snapshot file is mapped
+    """
+
+    return self.__snapshot is not None
+
+
+  def host(self, fqdn):
+    """ Returns the address and the update time of the host with the given
+        name or None
+    """
+
+    if self.__snapshot is None:
+      return None
+
+    entry = self.__snapshot.lookup(fqdn)
+
+    if entry is None or entry[0] != KIND_HOST:
+      return None
+
+    return unpack_address(entry[1]), entry[2]
+
+
+  def hosts(self):
+    """ Iterates over all (name, packed address, update time) tuples
+    """
+
+    if self.__snapshot is None:
+      return
+
+    for name, kind, address, updated in self.__snapshot.entries():
+      if kind == KIND_HOST:
+        yield name, address, updated
+
+
+  def is_suffix(self, name):
+    """ Checks if the given name is a defined suffix
+    """
+
+    if self.__snapshot is None:
+      return False
+
+    entry = self.__snapshot.lookup(name)
+
+    return entry is not None and entry[0] == KIND_SUFFIX
+
+
+@require(config='ddserver.config:Config',
+         logger='ddserver.utils.logger:Logger',
+         replica='ddserver.recursor.zone:ZoneReplica',
+         subscriber='ddserver.invalidation:Subscriber')
+def main(config,
+         logger,
+         replica,
+         subscriber):
+  """ Writes snapshots of the zone replica periodically
+
+      If invalidation is configured, a new snapshot is written as soon as a
+      host has been changed.
+  """
+
+  if not config.recursor.snapshot:
+    logger.error('snapshot: No snapshot file configured')
+    return
+
+  generation = None
+
+  while True:
+    replica.refresh()
+
+    # Only write a new snapshot if something has changed
+    if replica.generation != generation:
+      write(path=config.recursor.snapshot,
+            hosts=replica.hosts(),
+            suffixes=replica.suffixes)
+
+      generation = replica.generation
+
+      logger.debug('snapshot: Written snapshot with %d hosts', len(replica))
+
+    if subscriber.fileno() is None:
+      time.sleep(config.recursor.snapshot_interval)
+      continue
+
+    # Wait for the interval or until a host has been changed
+    readable, _, _ = select.select([subscriber], [], [],
+                                   config.recursor.snapshot_interval)
+
+    if readable and subscriber.receive():
+      replica.invalidate()
+
+
+if __name__ == '__main__':
+  main()
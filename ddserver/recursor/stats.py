@@ -0,0 +1,184 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import bisect
+import signal
+import collections
+
+from ddserver.utils.deps import require, extend, export
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_stats(config_decl):
+  with config_decl.declare('recursor') as s:
+    s('stats_file',
+      conv=str,
+      default='')
+
+
+class Histogram(object):
+  """ A histogram of durations
+
+      Durations are counted in buckets with exponentially growing upper bounds
+      in milliseconds. The last bucket counts all durations exceeding the
+      largest bound.
+  """
+
+  BOUNDS = (0.1, 0.2, 0.5,
+            1, 2, 5,
+            10, 20, 50,
+            100, 200, 500,
+            1000, 2000, 5000)
+
+
+  def __init__(self):
+    self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+    self.count = 0
+    self.total = 0.0
+    self.maximum = 0.0
+
+
+  def add(self, duration):
+    """ Counts a duration given in seconds
+    """
+
+    duration *= 1000.0
+
+    self.buckets[bisect.bisect_left(self.BOUNDS, duration)] += 1
+
+    self.count += 1
+    self.total += duration
+    self.maximum = max(self.maximum, duration)
+
+
+  def percentile(self, p):
+    """ Returns the upper bound of the bucket containing the given percentile
+    """
+
+    if self.count == 0:
+      return None
+
+    rank = p / 100.0 * self.count
+
+    seen = 0
+    for bound, count in zip(self.BOUNDS, self.buckets):
+      seen += count
+      if seen >= rank:
+        return bound
+
+    return self.maximum
+
+
+  @property
+  def stats(self):
+    labels = (['<=%g' % bound for bound in self.BOUNDS] +
+              ['>%g' % self.BOUNDS[-1]])
+
+    return {'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.maximum,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': collections.OrderedDict(zip(labels, self.buckets))}
+
+
+@export()
+class Statistics(object):
+  """ Counters and histograms of a recursor process.
+
+      The statistics are dumped to the log or to the configured statistics
+      file when the process receives SIGUSR1.
+  """
+
+  def __init__(self):
+    self.started = time.time()
+
+    self.queries = collections.Counter()
+
+    self.latency = Histogram()
+    self.db = Histogram()
+
+
+  def query(self, qtype, started):
+    """ Counts a query answered since the given start time
+    """
+
+    self.queries[qtype] += 1
+    self.latency.add(time.time() - started)
+
+
+  def database(self, started):
+    """ Counts a database round trip done since the given start time
+    """
+
+    self.db.add(time.time() - started)
+
+
+  @property
+  @require(cache='ddserver.recursor.cache:AnswerCache',
+           negative_cache='ddserver.recursor.cache:NegativeCache',
+           breaker='ddserver.recursor.breaker:CircuitBreaker')
+  def stats(self,
+            cache,
+            negative_cache,
+            breaker):
+    return collections.OrderedDict((('pid', os.getpid()),
+                                    ('uptime', time.time() - self.started),
+                                    ('queries', dict(self.queries)),
+                                    ('latency', self.latency.stats),
+                                    ('db', self.db.stats),
+                                    ('breaker', {'closed': breaker.closed,
+                                                 'opened': breaker.opened}),
+                                    ('cache', cache.stats),
+                                    ('negative_cache', negative_cache.stats)))
+
+
+  @require(config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def dump(self,
+           config,
+           logger):
+    """ Writes the statistics to the statistics file or to the log
+    """
+
+    if not config.recursor.stats_file:
+      # Dumps are requested explicitly, so they must not be filtered like
+      # informational messages
+      logger.warning('recursor: Statistics: %s', json.dumps(self.stats))
+      return
+
+    # Each process writes its own file, as there may be many recursors
+    path = '%s.%d' % (config.recursor.stats_file, os.getpid())
+
+    with open(path + '.tmp', 'w') as f:
+      json.dump(self.stats, f, indent=2)
+
+    os.rename(path + '.tmp', path)
+
+
+  def install(self):
+    """ Dumps the statistics when receiving SIGUSR1
+    """
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: self.dump())
@@ -0,0 +1,332 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import array
+import socket
+import struct
+
+import MySQLdb
+
+from ddserver.utils.deps import extend, export, require
+
+
+# Seconds before the last synchronization the changes are fetched again, as a
+# transaction may stamp its changes before but commit them after it
+SYNC_MARGIN = 10
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_replica(config_decl):
+  with config_decl.declare('recursor') as s:
+    s('replica',
+      conv=lambda v: v.strip().lower() in ('1', 'yes', 'true', 'on'),
+      default=False)
+    s('replica_interval',
+      conv=int,
+      default=10)
+    s('replica_reload',
+      conv=int,
+      default=3600)
+
+
+def pack_address(address):
+  """ Packs a dotted IPv4 address into an integer
+  """
+
+  return struct.unpack('!I', socket.inet_aton(address))[0]
+
+
+def unpack_address(packed):
+  """ Unpacks an integer into a dotted IPv4 address
+  """
+
+  return socket.inet_ntoa(struct.pack('!I', packed))
+
+
+@export()
+class ZoneReplica(object):
+  """ In-memory copy of all hosts and suffixes.
+
+      The replica maps the interned fully qualified names of all hosts having
+      an address to a slot in packed arrays of IPv4 addresses and update
+      times. Slots of removed hosts are reused.
+
+      After the initial load, only the hosts updated since the last
+      synchronization and the tombstones of deleted hosts are fetched from the
+      database. The changes of the last SYNC_MARGIN seconds before the last
+      synchronization are fetched again, as they may have been committed
+      after it. The replica is reloaded completely from time to time to forget
+      about tombstones pruned from the database.
+  """
+
+  def __init__(self):
+    self.__slots = {}
+    self.__addresses = array.array('I')
+    self.__updated = array.array('I')
+    self.__free = []
+
+    self.__suffixes = frozenset()
+
+    self.__synced = None
+    self.__next_sync = 0
+    self.__next_reload = 0
+
+    self.generation = 0
+
+
+  def __set(self, fqdn, address, updated):
+    fqdn = intern(fqdn.lower().encode('utf8'))
+
+    if address is None:
+      return self.__remove(fqdn)
+
+    address = pack_address(address)
+    updated = int(updated)
+
+    slot = self.__slots.get(fqdn)
+
+    # Changes fetched again are applied already
+    if (slot is not None and
+        self.__addresses[slot] == address and
+        self.__updated[slot] == updated):
+      return False
+
+    if slot is None:
+      if self.__free:
+        slot = self.__free.pop()
+
+      else:
+        slot = len(self.__addresses)
+        self.__addresses.append(0)
+        self.__updated.append(0)
+
+      self.__slots[fqdn] = slot
+
+    self.__addresses[slot] = address
+    self.__updated[slot] = updated
+
+    return True
+
+
+  def __remove(self, fqdn):
+    slot = self.__slots.pop(fqdn.lower(), None)
+
+    if slot is None:
+      return False
+
+    self.__free.append(slot)
+
+    return True
+
+
+  @require(db='ddserver.db:Database',
+           config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def load(self,
+           db,
+           config,
+           logger):
+    """ Loads all hosts and suffixes from the database
+    """
+
+    with db.cursor() as cur:
+      cur.execute('''
+          SELECT NOW() - INTERVAL %(margin)s SECOND AS `since`
+      ''', {'margin': SYNC_MARGIN})
+      since = cur.fetchone()['since']
+
+      cur.execute('''
+          SELECT `name`
+          FROM `suffixes`
+      ''')
+      suffixes = frozenset(suffix['name'].lower().encode('utf8')
+                           for suffix
+                           in cur.fetchall())
+
+      cur.execute('''
+          SELECT
+            `host`.`fqdn` AS `fqdn`,
+            `host`.`address` AS `address`,
+            UNIX_TIMESTAMP(`host`.`updated`) AS `updated`
+          FROM `hosts` AS `host`
+          WHERE `host`.`address` IS NOT NULL
+      ''')
+
+      self.__slots = {}
+      self.__addresses = array.array('I')
+      self.__updated = array.array('I')
+      self.__free = []
+
+      for host in cur:
+        self.__set(host['fqdn'], host['address'], host['updated'])
+
+    self.__suffixes = suffixes
+
+    self.__synced = since
+    self.__next_sync = time.time() + config.recursor.replica_interval
+    self.__next_reload = time.time() + config.recursor.replica_reload
+
+    self.generation += 1
+
+    logger.info('recursor: Loaded %d hosts into zone replica', len(self.__slots))
+
+
+  @require(db='ddserver.db:Database',
+           config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def sync(self,
+           db,
+           config,
+           logger):
+    """ Fetches the changes since the last synchronization from the database
+    """
+
+    with db.cursor() as cur:
+      cur.execute('''
+          SELECT NOW() - INTERVAL %(margin)s SECOND AS `since`
+      ''', {'margin': SYNC_MARGIN})
+      since = cur.fetchone()['since']
+
+      cur.execute('''
+          SELECT `name`
+          FROM `suffixes`
+      ''')
+      suffixes = frozenset(suffix['name'].lower().encode('utf8')
+                           for suffix
+                           in cur.fetchall())
+
+      # Timestamps have a resolution of seconds - changes happening in the
+      # same second as the last synchronization are fetched again
+      cur.execute('''
+          SELECT `fqdn`
+          FROM `tombstones`
+          WHERE `deleted` >= %(since)s
+      ''', {'since': self.__synced})
+      tombstones = cur.fetchall()
+
+      cur.execute('''
+          SELECT
+            `host`.`fqdn` AS `fqdn`,
+            `host`.`address` AS `address`,
+            UNIX_TIMESTAMP(`host`.`updated`) AS `updated`
+          FROM `hosts` AS `host`
+          WHERE `host`.`updated` >= %(since)s
+      ''', {'since': self.__synced})
+      hosts = cur.fetchall()
+
+    changed = suffixes != self.__suffixes
+
+    # Apply deletions before updates as a deleted name can be reused
+    for tombstone in tombstones:
+      if self.__remove(tombstone['fqdn']):
+        changed = True
+
+    for host in hosts:
+      if self.__set(host['fqdn'], host['address'], host['updated']):
+        changed = True
+
+    if changed:
+      self.generation += 1
+
+    self.__suffixes = suffixes
+
+    self.__synced = since
+    self.__next_sync = time.time() + config.recursor.replica_interval
+
+    logger.debug('recursor: Synchronized zone replica: %d updated, %d deleted',
+                 len(hosts),
+                 len(tombstones))
+
+
+  def invalidate(self):
+    """ Forces a synchronization on the next refresh
+    """
+
+    self.__next_sync = 0
+
+
+  @require(config='ddserver.config:Config',
+           logger='ddserver.utils.logger:Logger')
+  def refresh(self,
+              config,
+              logger):
+    """ Loads or synchronizes the replica if it is due
+
+        Once loaded, the replica is kept if the database fails and the load or
+        synchronization is retried after the synchronization interval.
+    """
+
+    now = time.time()
+
+    try:
+      if now >= self.__next_reload:
+        self.load()
+
+      elif now >= self.__next_sync:
+        self.sync()
+
+    except MySQLdb.OperationalError, e:
+      if self.__synced is None:
+        raise
+
+      logger.error('recursor: Failed to refresh zone replica: %s', e)
+
+      self.__next_sync = now + config.recursor.replica_interval
+      self.__next_reload = max(self.__next_reload, self.__next_sync)
+
+
+  def host(self, fqdn):
+    """ Returns the address and the update time of the host with the given
+        name or None
+    """
+
+    slot = self.__slots.get(fqdn.lower())
+
+    if slot is None:
+      return None
+
+    return unpack_address(self.__addresses[slot]), self.__updated[slot]
+
+
+  def is_suffix(self, name):
+    """ Checks if the given name is a defined suffix
+    """
+
+    return name.lower() in self.__suffixes
+
+
+  def hosts(self):
+    """ Iterates over all (name, packed address, update time) tuples
+    """
+
+    for fqdn, slot in self.__slots.iteritems():
+      yield fqdn, self.__addresses[slot], self.__updated[slot]
+
+
+  @property
+  def suffixes(self):
+    """ Returns the names of all suffixes
+    """
+
+    return self.__suffixes
+
+
+  def __len__(self):
+    return len(self.__slots)
@@ -19,6 +19,8 @@
 DROP TABLE IF EXISTS `users`;
 DROP TABLE IF EXISTS `suffixes`;
 DROP TABLE IF EXISTS `hosts`;
+DROP TABLE IF EXISTS `tombstones`;
+DROP TABLE IF EXISTS `changelog`;
 
 
 --
@@ -43,7 +45,8 @@ CREATE TABLE `users` (
 -- 
 CREATE TABLE `suffixes` (
   `id`          INT             NOT NULL AUTO_INCREMENT PRIMARY KEY,
-  `name`        VARCHAR(255)    NOT NULL UNIQUE
+  `name`        VARCHAR(255)    NOT NULL UNIQUE,
+  `serial`      INT UNSIGNED    NOT NULL DEFAULT 0
 
 ) ENGINE=InnoDB DEFAULT CHARACTER SET utf8;
 
@@ -56,6 +59,7 @@ CREATE TABLE `hosts` (
   `user_id`     INT             NOT NULL,
   `suffix_id`   INT             NOT NULL,
   `hostname`    VARCHAR(255)    NOT NULL,
+  `fqdn`        VARCHAR(255)    NOT NULL,
   `address`     VARCHAR(15)     NULL DEFAULT NULL,
   `description` VARCHAR(255)    NULL DEFAULT NULL,
   `password`    VARCHAR(255)    NOT NULL,
@@ -65,13 +69,46 @@ CREATE TABLE `hosts` (
   FOREIGN KEY (`suffix_id`)     REFERENCES `suffixes` (`id`) ON DELETE CASCADE ,
   
   UNIQUE (`hostname`, `suffix_id`),
+  UNIQUE (`fqdn`),
 
   INDEX (`address`),
+  INDEX (`updated`),
   INDEX (`user_id`, `hostname`)
 
 ) ENGINE=InnoDB DEFAULT CHARACTER SET utf8;
 
 
+--
+-- table tombstones (names of deleted hosts)
+--
+CREATE TABLE `tombstones` (
+  `fqdn`        VARCHAR(255)    NOT NULL,
+  `deleted`     TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  INDEX (`deleted`)
+
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8;
+
+
+--
+-- table changelog (address changes of hosts)
+--
+CREATE TABLE `changelog` (
+  `id`          INT UNSIGNED    NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  `suffix_id`   INT             NOT NULL,
+  `fqdn`        VARCHAR(255)    NOT NULL,
+  `old_address` VARCHAR(15)     NULL DEFAULT NULL,
+  `address`     VARCHAR(15)     NULL DEFAULT NULL,
+  `changed`     TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  FOREIGN KEY (`suffix_id`)     REFERENCES `suffixes` (`id`) ON DELETE CASCADE ,
+
+  INDEX (`suffix_id`, `id`),
+  INDEX (`changed`)
+
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8;
+
+
 --
 -- default user admin with password admin
 --
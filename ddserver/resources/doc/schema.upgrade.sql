@@ -57,3 +57,56 @@ ALTER TABLE `users`
 ALTER TABLE `hosts`
   DROP FOREIGN KEY `hosts_ibfk_1`,
   DROP FOREIGN KEY`hosts_ibfk_2` ;
+
+
+
+--
+-- Upgrading from version 0.2
+--
+
+ALTER TABLE `hosts`
+  ADD `fqdn` VARCHAR( 255 )
+  CHARACTER SET utf8 COLLATE utf8_general_ci
+  NULL DEFAULT NULL
+  AFTER `hostname` ;
+
+UPDATE `hosts` AS `host`
+  INNER JOIN `suffixes` AS `suffix`
+    ON ( `suffix`.`id` = `host`.`suffix_id` )
+  SET `host`.`fqdn` = CONCAT(`host`.`hostname`, '.', `suffix`.`name`) ;
+
+ALTER TABLE `hosts`
+  CHANGE `fqdn`
+  `fqdn` VARCHAR( 255 )
+  CHARACTER SET utf8 COLLATE utf8_general_ci
+  NOT NULL ,
+  ADD UNIQUE ( `fqdn` ) ;
+
+ALTER TABLE `hosts`
+  ADD INDEX ( `updated` ) ;
+
+CREATE TABLE `tombstones` (
+  `fqdn`        VARCHAR(255)    NOT NULL,
+  `deleted`     TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  INDEX (`deleted`)
+
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8;
+
+ALTER TABLE `suffixes`
+  ADD `serial` INT UNSIGNED NOT NULL DEFAULT 0 ;
+
+CREATE TABLE `changelog` (
+  `id`          INT UNSIGNED    NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  `suffix_id`   INT             NOT NULL,
+  `fqdn`        VARCHAR(255)    NOT NULL,
+  `old_address` VARCHAR(15)     NULL DEFAULT NULL,
+  `address`     VARCHAR(15)     NULL DEFAULT NULL,
+  `changed`     TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  FOREIGN KEY (`suffix_id`)     REFERENCES `suffixes` (`id`) ON DELETE CASCADE ,
+
+  INDEX (`suffix_id`, `id`),
+  INDEX (`changed`)
+
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8;
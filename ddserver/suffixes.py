@@ -0,0 +1,175 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import time
+import threading
+
+import MySQLdb
+
+from ddserver.utils.deps import extend, export, require
+
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_suffixes(config_decl):
+  with config_decl.declare('dns') as s:
+    s('suffixes_refresh',
+      conv = int,
+      default = 60)
+
+
+
+@export()
+class SuffixRegistry(object):
+  ''' In-memory registry of all suffixes.
+
+      The suffixes are loaded from the database and reloaded periodically or
+      after being invalidated. If reloading fails, the loaded suffixes are kept
+      until the next try. Names are matched against the suffixes using a tree
+      of the reversed labels of the suffix names.
+  '''
+
+  # Key of the suffix stored in a node of the tree
+  SUFFIX = None
+
+
+  def __init__(self):
+    self.__lock = threading.Lock()
+
+    self.__suffixes = []
+    self.__ids = {}
+    self.__names = {}
+    self.__tree = {}
+
+    self.__next_refresh = 0
+    self.__loaded = False
+
+
+  @require(db = 'ddserver.db:Database',
+           config = 'ddserver.config:Config',
+           logger = 'ddserver.utils.logger:Logger')
+  def refresh(self,
+              db,
+              config,
+              logger):
+    ''' Reloads the suffixes from the database if they are outdated. '''
+
+    if time.time() < self.__next_refresh:
+      return
+
+    with self.__lock:
+      # Another thread may have done the reload while waiting for the lock
+      if time.time() < self.__next_refresh:
+        return
+
+      try:
+        with db.cursor() as cur:
+          cur.execute('''
+              SELECT `id`, `name`, `serial`
+              FROM `suffixes`
+              ORDER BY `name`
+          ''')
+          suffixes = cur.fetchall()
+
+      except MySQLdb.OperationalError, e:
+        if not self.__loaded:
+          raise
+
+        logger.error('Failed to reload suffixes: %s', e)
+
+        self.__next_refresh = time.time() + config.dns.suffixes_refresh
+        return
+
+      ids = {}
+      names = {}
+      tree = {}
+
+      for suffix in suffixes:
+        name = suffix['name'].lower()
+
+        ids[suffix['id']] = suffix
+        names[name] = suffix
+
+        node = tree
+        for label in reversed(name.split('.')):
+          node = node.setdefault(label, {})
+
+        node[self.SUFFIX] = suffix
+
+      # Replace the registry at once, as readers do not lock
+      self.__suffixes, self.__ids, self.__names, self.__tree = suffixes, ids, names, tree
+
+      self.__next_refresh = time.time() + config.dns.suffixes_refresh
+      self.__loaded = True
+
+
+  def invalidate(self):
+    ''' Forces a reload on the next access. '''
+
+    self.__next_refresh = 0
+
+
+  @property
+  def suffixes(self):
+    ''' Returns all suffixes ordered by name. '''
+
+    self.refresh()
+
+    return self.__suffixes
+
+
+  def get(self, name):
+    ''' Returns the suffix with the given name or None. '''
+
+    self.refresh()
+
+    return self.__names.get(name.lower())
+
+
+  def by_id(self, suffix_id):
+    ''' Returns the suffix with the given ID or None. '''
+
+    self.refresh()
+
+    return self.__ids.get(suffix_id)
+
+
+  def match(self, name):
+    ''' Returns the longest suffix of the given name or None.
+
+        A name is a suffix of itself.
+    '''
+
+    self.refresh()
+
+    suffix = None
+
+    node = self.__tree
+    for label in reversed(name.lower().split('.')):
+      node = node.get(label)
+      if node is None:
+        break
+
+      suffix = node.get(self.SUFFIX, suffix)
+
+    return suffix
+
+
+  def __contains__(self, name):
+    return self.get(name) is not None
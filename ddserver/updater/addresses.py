@@ -0,0 +1,132 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import collections
+
+from ddserver.utils.deps import extend, export, require
+from ddserver.utils.cache import LRUCache
+from ddserver.updater.credentials import verify
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_addresses(config_decl):
+  with config_decl.declare('updater') as s:
+    s('address_map_size',
+      conv=int,
+      default=100000)
+    s('address_map_ttl',
+      conv=int,
+      default=60)
+
+
+# A host as seen by the updater
+Host = collections.namedtuple('Host', ['username',
+                                       'active',
+                                       'id',
+                                       'password',
+                                       'address'])
+
+
+@export(config='ddserver.config:Config')
+def AddressMap(config):
+  """ The current addresses of the hosts updated recently.
+
+      The hosts are mapped by their lower case fully qualified names. The map
+      is filled whenever a host is fetched from the database for an update.
+      Hosts changed by other processes are evicted as soon as the invalidation
+      message arrives.
+
+      As invalidation messages are datagrams and may be lost, the entries
+      expire after a short time, so a missed change is not trusted for longer
+      than the TTL of the DNS records. The same holds for users deactivated
+      directly in the database, which is not published at all.
+  """
+
+  return LRUCache(max_entries=config.updater.address_map_size,
+                  ttl=config.updater.address_map_ttl)
+
+
+@require(addresses='ddserver.updater.addresses:AddressMap')
+def remember(username,
+             active,
+             host,
+             address,
+             addresses):
+  """ Remember the address of a host owned by the given user
+
+      The active flag of the user is kept, so hosts of inactive users are
+      never taken as unchanged.
+  """
+
+  addresses.put(host['fqdn'].lower(), Host(username=username,
+                                           active=bool(active),
+                                           id=host['id'],
+                                           password=host['password'],
+                                           address=address))
+
+
+@require(addresses='ddserver.updater.addresses:AddressMap',
+         subscriber='ddserver.invalidation:Subscriber')
+def forget(addresses,
+           subscriber,
+           names=()):
+  """ Forget the hosts changed since the last call and the given ones
+  """
+
+  for name in subscriber.receive():
+    addresses.discard(name)
+
+  for name in names:
+    addresses.discard(name.lower())
+
+
+@require(addresses='ddserver.updater.addresses:AddressMap',
+         subscriber='ddserver.invalidation:Subscriber')
+def unchanged(username,
+              password,
+              hostnames,
+              address,
+              addresses,
+              subscriber):
+  """ Check if all hosts are known to have the address already
+
+      The check requires invalidation, as changes made by the web interface
+      would not be noticed otherwise. The result is False if any of the hosts
+      is not in the map, owned by another or an inactive user or the password
+      does not match, so the update must be checked against the database.
+  """
+
+  if subscriber.fileno() is None:
+    return False
+
+  forget()
+
+  for hostname in hostnames:
+    host = addresses.get(hostname.lower())
+
+    if host is None or host.username != username or host.address != address:
+      return False
+
+    if not host.active:
+      return False
+
+    if not verify(password, host._asdict()):
+      return False
+
+  return True
@@ -0,0 +1,86 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import hmac
+import hashlib
+
+from passlib.apps import custom_app_context as pwd
+
+from ddserver.utils.deps import extend, export, require
+from ddserver.utils.cache import LRUCache
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_credentials(config_decl):
+  with config_decl.declare('updater') as s:
+    s('credentials_cache_size',
+      conv=int,
+      default=10000)
+    s('credentials_cache_ttl',
+      conv=int,
+      default=3600)
+
+
+# The key of the password digests - the cache is never shared between
+# processes, so the key is not kept over restarts
+SECRET = os.urandom(32)
+
+
+@export(config='ddserver.config:Config')
+def CredentialCache(config):
+  """ The cache of successfully verified host credentials.
+
+      The entries are keyed by the host ID, the stored password hash and a
+      keyed digest of the submitted password, so the plain password is never
+      kept in memory. As the stored hash changes with the password, changing
+      the password of a host invalidates its entries. Entries of deleted hosts
+      are never looked up again and expire.
+  """
+
+  return LRUCache(max_entries=config.updater.credentials_cache_size,
+                  ttl=config.updater.credentials_cache_ttl)
+
+
+@require(cache='ddserver.updater.credentials:CredentialCache')
+def verify(password,
+           host,
+           cache):
+  """ Verify the password submitted for a host
+
+      The expensive hash is only computed if the credentials have not been
+      verified recently.
+  """
+
+  if isinstance(password, unicode):
+    password = password.encode('utf8')
+
+  key = (host['id'],
+         host['password'],
+         hmac.new(SECRET, password, hashlib.sha256).digest())
+
+  if cache.get(key):
+    return True
+
+  if not pwd.verify(password, host['password']):
+    return False
+
+  cache.put(key, True)
+
+  return True
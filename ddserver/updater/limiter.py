@@ -0,0 +1,89 @@
+"""
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from ddserver.utils.deps import extend, export, require
+from ddserver.utils.ratelimit import TokenBuckets
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_limiter(config_decl):
+  with config_decl.declare('updater') as s:
+    s('limit_user_burst',
+      conv=int,
+      default=30)
+    s('limit_user_rate',
+      conv=float,
+      default=10.0)
+    s('limit_host_burst',
+      conv=int,
+      default=5)
+    s('limit_host_rate',
+      conv=float,
+      default=1.0)
+    s('limit_address_burst',
+      conv=int,
+      default=30)
+    s('limit_address_rate',
+      conv=float,
+      default=10.0)
+    s('limit_size',
+      conv=int,
+      default=100000)
+
+
+@export()
+class Limiter(object):
+  """ Limits the rate of update requests.
+
+      Requests are limited per user, per host and per client address using
+      token buckets. Each request takes a token from the bucket of its user
+      and its client address and from the bucket of each requested host. The
+      rates are given in requests per minute.
+  """
+
+  @require(config='ddserver.config:Config')
+  def __init__(self,
+               config):
+    self.__users = TokenBuckets(burst=config.updater.limit_user_burst,
+                                rate=config.updater.limit_user_rate,
+                                max_entries=config.updater.limit_size)
+    self.__hosts = TokenBuckets(burst=config.updater.limit_host_burst,
+                                rate=config.updater.limit_host_rate,
+                                max_entries=config.updater.limit_size)
+    self.__addresses = TokenBuckets(burst=config.updater.limit_address_burst,
+                                    rate=config.updater.limit_address_rate,
+                                    max_entries=config.updater.limit_size)
+
+
+  def allow(self, username, hostnames, address):
+    """ Checks if a request is within the limits
+    """
+
+    if not self.__addresses.take(address):
+      return False
+
+    # Usernames are matched case insensitively, as by the blocklist
+    if username and not self.__users.take(username.lower()):
+      return False
+
+    for hostname in hostnames:
+      if not self.__hosts.take(hostname.lower()):
+        return False
+
+    return True
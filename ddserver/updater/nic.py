@@ -22,10 +22,11 @@ import bottle
 
 import formencode
 
-from passlib.apps import custom_app_context as pwd
-
 from ddserver.utils.deps import require
 from ddserver.web import route
+from ddserver.changes import record_changes
+from ddserver.updater.credentials import verify
+from ddserver.updater.addresses import remember, forget, unchanged
 
 
 # See http://www.noip.com/integrate for further protocol specification
@@ -65,8 +66,9 @@ resp_911 = functools.partial(Response, '911', None)
 
 
 @require(logger='ddserver.utils.logger:Logger',
-         db='ddserver.db:Database')
-def update(logger, db, username, password, hostnames, address):
+         db='ddserver.db:Database',
+         publisher='ddserver.invalidation:Publisher')
+def update(logger, db, publisher, username, password, hostnames, address):
   """ Update the records.
 
       The very first step is to check username and password. If they are not
@@ -74,7 +76,11 @@ def update(logger, db, username, password, hostnames, address):
       returned.
 
       If the credentials are checked, for each given hostname, the address is
-      stored in the database.
+      stored in the database. All hosts are fetched using a single query and
+      all changed hosts are updated in a single transaction.
+
+      Updates reporting the known address of all hosts are answered without
+      accessing the database.
   """
 
   # Check if we get some credentials
@@ -82,20 +88,31 @@ def update(logger, db, username, password, hostnames, address):
     logger.warning('updater: Update attempt with missing credentials')
     return resp_badauth()
 
+  # Most clients report the address they have reported before
+  if unchanged(username, password, hostnames, address):
+    logger.debug('updater: Addresses have not changed: %s', address)
+
+    return [resp_nochg(value=address)
+            for hostname
+            in hostnames]
+
   # Try to get user ID from database
   with db.cursor() as cur:
     cur.execute('''
-      SELECT `id`, `password`
+      SELECT `id`, `password`, `active`
         FROM `users`
        WHERE `username` = %(username)s
-         AND `active` = 1
     ''', {'username': username})
     user = cur.fetchone()
 
   # Check if we have a valid user
-  if not user:
+  if not user or not user['active']:
     logger.warning('updater: Update attempt with invalid username %s',
                    username)
+
+    # The hosts of a deactivated user must not be answered from the map
+    forget(names=hostnames)
+
     return resp_badauth()
 
   logger.debug('updater: Found user in DB: %s', user)
@@ -111,25 +128,34 @@ def update(logger, db, username, password, hostnames, address):
     return resp_abuse()
 
   # The specification allows to give multiple hosts separated by comma
+  logger.debug('updater: Fetching existing host entries for %s', hostnames)
+
+  # Get the host entries for all hostnames from the database at once
+  with db.cursor() as cur:
+    cur.execute('''
+      SELECT
+        `host`.`id`,
+        `host`.`fqdn`,
+        `host`.`address`,
+        `host`.`password`
+      FROM `hosts` AS `host`
+      WHERE `host`.`fqdn` IN (%s)
+        AND `host`.`user_id` = %%(user_id)s
+    ''' % ', '.join('%%(hostname%d)s' % i
+                      for i
+                      in range(len(hostnames))),
+                dict({'hostname%d' % i: hostname
+                      for i, hostname
+                      in enumerate(hostnames)},
+                     user_id=user['id']))
+    hosts = {host['fqdn'].lower(): host
+             for host
+             in cur.fetchall()}
+
   responses = []
+  updated = {}
   for hostname in hostnames:
-    logger.debug('updater: Fetching existing host entry for %s', hostname)
-
-    # Get the host entry for the current hostname from the database
-    with db.cursor() as cur:
-      cur.execute('''
-        SELECT
-          `host`.`id`,
-          `host`.`address`,
-          `host`.`password`
-        FROM `hosts` AS `host`
-        LEFT JOIN `suffixes` AS `suffix`
-           ON ( `suffix`.`id` = `host`.`suffix_id` )
-        WHERE `host`.`user_id` = %(user_id)s
-          AND CONCAT(`host`.`hostname`, '.', `suffix`.`name`) = %(hostname)s
-      ''', {'user_id': user['id'],
-            'hostname': hostname})
-      host = cur.fetchone()
+    host = hosts.get(hostname.lower())
 
     # Check if we got a host entry for the queried hostname
     if not host:
@@ -140,7 +166,7 @@ def update(logger, db, username, password, hostnames, address):
       continue
 
     # Check the users credentials (passwords are assigned to hosts)
-    if not pwd.verify(password, host['password']):
+    if not verify(password, host):
       logger.warning('updater: Mismatching credentials for host %s',
                      hostname)
 
@@ -152,33 +178,52 @@ def update(logger, db, username, password, hostnames, address):
       logger.debug('updater: Address has not changed: %s',
                    address)
 
+      remember(username, user['active'], host, address)
+
       responses.append(resp_nochg(value=address))
       continue
 
-    # validate the ip address
-    try:
-      validator = formencode.validators.IPAddress()
-      validator.to_python(address)
+    updated[host['id']] = host
 
-    except formencode.Invalid:
-      logger.debug('Invalid IP address in update request: %s', address)
+    responses.append(resp_good(value=address))
 
-      responses.append(resp_abuse())
-      continue
+  if not updated:
+    return responses
+
+  # Update all changed host entries at once
+  condition = '`id` IN (%s)' % ', '.join('%%(id%d)s' % i
+                                         for i
+                                         in range(len(updated)))
+  args = {'id%d' % i: host_id
+          for i, host_id
+          in enumerate(updated)}
 
-    # Update the host entry
-    with db.cursor() as cur:
-      cur.execute('''
-          UPDATE `hosts`
-          SET `address` = %(address)s,
-              `updated` = CURRENT_TIMESTAMP
-          WHERE `id` = %(id)s
-      ''', {'id': host['id'],
-            'address': address})
+  with db.cursor() as cur:
+    record_changes(cur, condition, args,
+                   address=address)
+
+    # Hosts changed to the same address in the meantime are left alone
+    cur.execute('''
+        UPDATE `hosts`
+        SET `address` = %%(address)s,
+            `updated` = CURRENT_TIMESTAMP
+        WHERE %s
+          AND NOT `address` <=> %%(address)s
+    ''' % condition, dict(args,
+                           address=address))
 
-    logger.info('updater: Host entry updated: %s = %s', hostname, address)
+  # Evict the hosts from the caches of the recursors
+  publisher.publish([host['fqdn']
+                     for host
+                     in updated.itervalues()])
 
-    responses.append(resp_good(value=address))
+  # Skip the invalidation published above before remembering the addresses
+  forget()
+
+  for host in updated.itervalues():
+    remember(username, user['active'], host, address)
+
+    logger.info('updater: Host entry updated: %s = %s', host['fqdn'], address)
 
   return responses
 
@@ -193,8 +238,12 @@ def get_ip():
 
 
 @route('/nic/update', method='GET')
-@require(logger='ddserver.utils.logger:Logger')
-def get_update(logger):
+@require(logger='ddserver.utils.logger:Logger',
+         limiter='ddserver.updater.limiter:Limiter',
+         blocklist='ddserver.utils.blocklist:AuthBlocklist')
+def get_update(logger,
+               limiter,
+               blocklist):
   """ Handles an update request from a ddclient implementation.
   """
 
@@ -219,20 +268,53 @@ def get_update(logger):
 
     logger.info('updater: Update request for %s as %s', hostnames, address)
 
-    # Call the update function
-    try:
-      responses = update(username=username,
-                         password=password,
-                         hostnames=hostnames,
-                         address=address)
+    # The client address and the user failing to authenticate repeatedly
+    keys = [('address', bottle.request.remote_addr)]
+    if username:
+      keys.append(('user', username.lower()))
 
-    except:
+    # Reject clients failing to authenticate or exceeding the limits before
+    # checking the credentials
+    if blocklist.blocked(*keys):
+      logger.warning('updater: Blocked update attempt by %s as %s',
+                     bottle.request.remote_addr, username)
+
+      # Clients stop updating for good on abuse, but retry later on 911
       responses = resp_911()
 
+    elif not limiter.allow(username, hostnames, bottle.request.remote_addr):
+      logger.warning('updater: Rate limit exceeded by %s for %s',
+                     bottle.request.remote_addr, hostnames)
+
+      responses = resp_abuse()
+
+    else:
+      # Call the update function
+      try:
+        responses = update(username=username,
+                           password=password,
+                           hostnames=hostnames,
+                           address=address)
+
+      except:
+        responses = resp_911()
+
     # Blow up responses if we got a single response
     if isinstance(responses, Response):
       responses = [responses] * len(hostnames)
 
+    # Track the authentication failures of the client and the user
+    if any(response.name == 'badauth'
+           for response
+           in responses):
+      blocklist.failure(*keys)
+
+    elif any(response.name in ('good', 'nochg')
+             for response
+             in responses):
+      # The client address may be shared with others, so it keeps its failures
+      blocklist.success(('user', username.lower()))
+
   # if no hostnames were provided, this is invalid usage of
   # the update protocol.
   else:
@@ -0,0 +1,138 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import time
+import collections
+
+from ddserver.utils.deps import extend, export
+from ddserver.utils.cache import LRUCache
+
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_blocklist(config_decl):
+  with config_decl.declare('auth') as s:
+    s('block_threshold',
+      conv = int,
+      default = 5)
+    s('block_delay',
+      conv = int,
+      default = 1)
+    s('block_max',
+      conv = int,
+      default = 900)
+    s('block_forget',
+      conv = int,
+      default = 3600)
+    s('block_size',
+      conv = int,
+      default = 100000)
+
+
+
+class Blocklist(object):
+  ''' Blocks keys after repeated failures.
+
+      Once the number of failures of a key reaches the threshold, the key is
+      blocked for the delay. The delay doubles with each further failure up
+      to the maximum. A success resets the key. Keys without failures for the
+      forget time are dropped, as are the least recently used keys if there
+      are too many.
+  '''
+
+  Entry = collections.namedtuple('Entry', ['failures',
+                                           'blocked'])
+
+
+  def __init__(self, threshold, delay, maximum, forget, max_entries):
+    ''' Creates a blocklist.
+
+        @param threshold: the number of failures blocking a key - zero
+                          disables the blocklist
+        @param delay: the time in seconds a key is blocked at first
+        @param maximum: the maximum time in seconds a key is blocked
+        @param forget: the time in seconds the failures of a key are kept
+        @param max_entries: the maximum number of keys kept in memory
+    '''
+
+    self.__threshold = threshold
+    self.__delay = delay
+    self.__maximum = maximum
+    self.__forget = forget
+
+    self.__entries = LRUCache(max_entries = max_entries)
+
+
+  def blocked(self, *keys):
+    ''' Checks if any of the keys is blocked. '''
+
+    now = time.time()
+
+    for key in keys:
+      entry = self.__entries.get(key)
+
+      if entry is not None and entry.blocked > now:
+        return True
+
+    return False
+
+
+  def failure(self, *keys):
+    ''' Records a failure for each of the keys. '''
+
+    if self.__threshold <= 0:
+      return
+
+    now = time.time()
+
+    for key in keys:
+      entry = self.__entries.get(key)
+      failures = entry.failures + 1 if entry is not None else 1
+
+      blocked = 0
+      if failures >= self.__threshold:
+        blocked = now + min(self.__maximum,
+                            self.__delay * 2 ** min(failures - self.__threshold, 32))
+
+      self.__entries.put(key, self.Entry(failures = failures,
+                                         blocked = blocked),
+                         ttl = max(blocked - now, 0) + self.__forget)
+
+
+  def success(self, *keys):
+    ''' Resets the keys. '''
+
+    for key in keys:
+      self.__entries.discard(key)
+
+
+
+@export(config = 'ddserver.config:Config')
+def AuthBlocklist(config):
+  ''' The blocklist of client addresses and usernames failing to authenticate.
+
+      Keys are tuples of a kind and a value, like ('address', '192.0.2.1') or
+      ('user', 'alice').
+  '''
+
+  return Blocklist(threshold = config.auth.block_threshold,
+                   delay = config.auth.block_delay,
+                   maximum = config.auth.block_max,
+                   forget = config.auth.block_forget,
+                   max_entries = config.auth.block_size)
@@ -0,0 +1,194 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import sys
+import time
+import collections
+
+
+
+def sizeof(value):
+  ''' Estimates the memory used by a value.
+
+      Tuples and lists are followed recursively, all other values are measured
+      by their own size only.
+  '''
+
+  size = sys.getsizeof(value)
+
+  if isinstance(value, (tuple, list)):
+    size += sum(sizeof(item)
+                for item
+                in value)
+
+  return size
+
+
+
+class LRUCache(object):
+  ''' A bounded cache with expiring entries.
+
+      The cache holds at most max_entries entries using at most max_memory
+      bytes as estimated by sizeof. If one of the limits is exceeded, the least
+      recently used entries are evicted.
+
+      Each entry expires after the TTL given when it was stored. Expired entries
+      are kept for the grace period, so they can be returned on explicit request
+      while a fresh value can not be obtained. Entries expired for longer are
+      dropped on access.
+  '''
+
+  Entry = collections.namedtuple('Entry', ['value',
+                                           'expires',
+                                           'size'])
+
+
+  def __init__(self, max_entries, max_memory = None, ttl = None, grace = 0):
+    ''' Creates a cache.
+
+        @param max_entries: the maximum number of entries
+        @param max_memory: the maximum number of bytes used by the entries or
+                           None for no limit
+        @param ttl: the default lifetime of an entry in seconds
+        @param grace: the time in seconds expired entries are kept
+    '''
+
+    self.__max_entries = max_entries
+    self.__max_memory = max_memory
+    self.__ttl = ttl
+    self.__grace = grace
+
+    self.__entries = collections.OrderedDict()
+    self.__memory = 0
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.stale_hits = 0
+
+
+  def get(self, key, default = None, stale = False):
+    ''' Returns the value stored for the key.
+
+        If no value is stored for the key or the stored value is expired, the
+        default is returned. If stale is set, values expired less than the
+        grace period ago are returned, too.
+    '''
+
+    entry = self.__entries.pop(key, None)
+
+    if entry is None:
+      self.misses += 1
+      return default
+
+    now = time.time()
+
+    if entry.expires <= now:
+      if entry.expires + self.__grace <= now:
+        self.__memory -= entry.size
+
+      else:
+        # Keep the expired entry for the grace period
+        self.__entries[key] = entry
+
+        if stale:
+          self.stale_hits += 1
+          return entry.value
+
+      self.misses += 1
+      return default
+
+    # Re-insert the entry to mark it as recently used
+    self.__entries[key] = entry
+
+    self.hits += 1
+    return entry.value
+
+
+  def put(self, key, value, ttl = None):
+    ''' Stores the value for the key.
+
+        @param ttl: the lifetime of the entry - the default lifetime of the
+                    cache is used if None
+    '''
+
+    if ttl is None:
+      ttl = self.__ttl
+
+    self.discard(key)
+
+    entry = self.Entry(value = value,
+                       expires = time.time() + ttl,
+                       size = sizeof(key) + sizeof(value))
+
+    self.__entries[key] = entry
+    self.__memory += entry.size
+
+    # Evict least recently used entries until the cache fits into its limits
+    while (len(self.__entries) > self.__max_entries or
+           (self.__max_memory is not None and self.__memory > self.__max_memory)):
+      _, evicted = self.__entries.popitem(last = False)
+      self.__memory -= evicted.size
+
+      self.evictions += 1
+
+
+  def discard(self, key):
+    ''' Removes the entry for the key if it exists. '''
+
+    entry = self.__entries.pop(key, None)
+
+    if entry is not None:
+      self.__memory -= entry.size
+
+
+  def clear(self):
+    ''' Removes all entries. '''
+
+    self.__entries.clear()
+    self.__memory = 0
+
+
+  def __len__(self):
+    return len(self.__entries)
+
+
+  def __contains__(self, key):
+    entry = self.__entries.get(key)
+
+    return entry is not None and entry.expires > time.time()
+
+
+  @property
+  def memory(self):
+    ''' Returns the estimated number of bytes used by the entries. '''
+
+    return self.__memory
+
+
+  @property
+  def stats(self):
+    ''' Returns the counters of the cache. '''
+
+    return {'entries': len(self.__entries),
+            'memory': self.__memory,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'stale_hits': self.stale_hits}
@@ -0,0 +1,74 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import time
+
+from ddserver.utils.cache import LRUCache
+
+
+
+class TokenBuckets(object):
+  ''' A set of token buckets identified by keys.
+
+      Each bucket holds up to burst tokens and is refilled with rate tokens per
+      minute. Taking a token from an empty bucket fails. Buckets are created
+      full on first use and forgotten once they would be full again, so only
+      the buckets of recently seen keys are kept in memory.
+  '''
+
+  def __init__(self, burst, rate, max_entries):
+    ''' Creates the buckets.
+
+        @param burst: the capacity of a bucket
+        @param rate: the number of tokens added to a bucket per minute
+        @param max_entries: the maximum number of buckets kept in memory
+
+        No limit is applied if the burst or the rate is zero.
+    '''
+
+    self.__enabled = burst > 0 and rate > 0
+
+    self.__burst = burst
+    self.__rate = rate / 60.0
+
+    # A bucket is full again after this time and can be dropped
+    self.__buckets = LRUCache(max_entries = max_entries,
+                              ttl = burst / self.__rate if self.__enabled else 0)
+
+
+  def take(self, key):
+    ''' Takes a token from the bucket of the key.
+
+        Returns False if the bucket is empty.
+    '''
+
+    if not self.__enabled:
+      return True
+
+    now = time.time()
+
+    tokens, last = self.__buckets.get(key, (self.__burst, now))
+    tokens = min(self.__burst, tokens + (now - last) * self.__rate)
+
+    if tokens < 1:
+      self.__buckets.put(key, (tokens, now))
+      return False
+
+    self.__buckets.put(key, (tokens - 1, now))
+    return True
@@ -44,6 +44,12 @@ class FieldDeclaration(object):
     return self.__name
 
 
+  @property
+  def conv(self):
+    ''' Returns the type converter function. '''
+    return self.__conv
+
+
   def lex(self, value):
     ''' Lex the field. '''
 
@@ -75,6 +81,8 @@ class MessageDeclaration(object):
                                                                 for field
                                                                 in self.__fields])
 
+    self.__lexer = self.compile_lexer()
+
 
   @property
   def tag(self):
@@ -83,6 +91,72 @@ class MessageDeclaration(object):
     return self.__tag
 
 
+  @property
+  def lexer(self):
+    ''' Returns the lexer function generated for the message. '''
+
+    return self.__lexer
+
+
+  def compile_lexer(self):
+    ''' Generates a function lexing the values of the message.
+
+        The generated function converts each value using the converter of the
+        according field and creates the message tuple directly. Converting
+        string fields is skipped as the values are strings already.
+    '''
+
+    namespace = {'new': tuple.__new__,
+                 'type': self.__type,
+                 'tag': self.__tag}
+
+    values = []
+    for i, field in enumerate(self.__fields):
+      if field.conv is str:
+        values.append('load[%d]' % i)
+
+      else:
+        namespace['conv%d' % i] = field.conv
+        values.append('conv%d(load[%d])' % (i, i))
+
+    source = ('def lex(load):\n'
+              '  return new(type, (tag, %s))\n' % ''.join(value + ', '
+                                                          for value
+                                                          in values))
+
+    exec source in namespace
+
+    return namespace['lex']
+
+
+  def compile_formatter(self, splitter):
+    ''' Generates a function formatting the message including its tag.
+
+        The generated function formats all values of the message using a
+        single format string. The values are converted using str() first, as
+        the format string would turn the result into unicode if any of the
+        values is unicode.
+    '''
+
+    # Fields with a custom format can not be formatted using a format string
+    if any(type(field).format != FieldDeclaration.format
+           for field
+           in self.__fields):
+      return lambda message: splitter.join([message.tag] + self.format(message))
+
+    namespace = {'str': str,
+                 'template': splitter.replace('%', '%%').join(['%s'] * (len(self.__fields) + 1))}
+
+    source = ('def format(message):\n'
+              '  return template %% (message[0], %s)\n' % ''.join('str(message[%d]), ' % (i + 1)
+                                                                 for i
+                                                                 in xrange(len(self.__fields))))
+
+    exec source in namespace
+
+    return namespace['format']
+
+
   def lex(self, load):
     ''' Lex the message. '''
 
@@ -122,6 +196,10 @@ class LexerDeclaration(object):
                        for message
                        in messages}
 
+    self.__lexers = {message.tag : message.lexer
+                     for message
+                     in messages}
+
 
   def __call__(self, line):
     ''' Lex the line. '''
@@ -133,10 +211,12 @@ class LexerDeclaration(object):
     # Split message in tag and values
     tag, values = message[0], message[1:]
 
-    # Find message declaration for tag and lex the values using this message
-    # declaration or return None if the tag is unknown
-    if tag in self.__messages:
-      return self.__messages[tag].lex(values)
+    # Find the lexer for tag and lex the values using this lexer or return
+    # None if the tag is unknown
+    lexer = self.__lexers.get(tag)
+
+    if lexer is not None:
+      return lexer(values)
 
     else:
       return None
@@ -156,15 +236,14 @@ class FormatterDeclaration(object):
                        for message
                        in messages}
 
+    self.__formatters = {message.tag : message.compile_formatter(splitter)
+                         for message
+                         in messages}
 
-  def __call__(self, message):
-    # Find the message declaration for tag and format the values using this
-    # message declaration
-    load = self.__messages[message.tag].format(message)
-
-    # Join the message parts separated by the splitter character
-    return self.__splitter.join([message.tag] + load)
 
+  def __call__(self, message):
+    # Find the formatter for tag and format the message using this formatter
+    return self.__formatters[message.tag](message)
 
 
   def __getattr__(self, key):
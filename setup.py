@@ -45,7 +45,7 @@ setuptools.setup(
         'formencode >= 1.2',
         'passlib >= 1.6',
         'recaptcha-client >= 1.0',
-        'MySQL-python >= 1.2.0'
+        'MySQL-python >= 1.2.5'
     ],
 
     packages = setuptools.find_packages(),
@@ -99,6 +99,9 @@ setuptools.setup(
             'ddserver-updater = ddserver.updater.__main__:main',
             'ddserver-bundle = ddserver.__main__:main',
             'ddserver-recursor = ddserver.recursor.__main__:main',
+            'ddserver-snapshot = ddserver.recursor.snapshot:main',
+            'ddserver-dns = ddserver.nameserver.__main__:main',
+            'ddserver-remote = ddserver.recursor.remote:main',
         ]
     },
 )
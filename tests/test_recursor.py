@@ -0,0 +1,154 @@
+'''
+Copyright 2014 Dustin Frisch <fooker@lab.sh>
+
+This file is part of ddserver.
+
+ddserver is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+ddserver is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with ddserver. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+''' Tests of the recursor.
+
+    The database is replaced by a stand-in answering the queries of the
+    recursor from fixed rows and recording all queries. Run from the source
+    directory:
+
+      python -m unittest discover tests
+'''
+
+import os
+import tempfile
+import unittest
+import contextlib
+
+from ddserver.recursor.resolver import warm, resolve
+from ddserver.utils.deps import extend, Export
+
+
+
+SUFFIX = {'id': 1, 'name': 'dyn.example.com', 'serial': 1}
+
+HOSTS = [{'fqdn': 'host%d.dyn.example.com' % i,
+          'address': '10.0.0.%d' % i,
+          'updated': 0}
+         for i
+         in range(1, 4)]
+
+
+
+class StandInDatabase(object):
+  ''' Database answering the queries of the recursor from fixed rows. '''
+
+  def __init__(self):
+    self.queries = []
+
+
+  @contextlib.contextmanager
+  def cursor(self, **kwargs):
+    rows = []
+
+    def execute(query, args = None):
+      self.queries.append(query)
+
+      if 'FROM `suffixes`' in query:
+        rows[:] = [SUFFIX]
+
+      elif 'FROM `hosts`' in query:
+        names = set((args or {}).values())
+        rows[:] = [host
+                   for host
+                   in HOSTS
+                   if host['fqdn'] in names]
+
+      else:
+        rows[:] = []
+
+    yield type('Cursor', (object,), {
+        'execute': lambda _, query, args = None: execute(query, args),
+        'fetchone': lambda _: rows[0] if rows else None,
+        'fetchall': lambda _: list(rows),
+    })()
+
+
+
+hotset = tempfile.NamedTemporaryFile(suffix = '.hotset')
+hotset.write(''.join(host['fqdn'] + '\n'
+                     for host
+                     in HOSTS[:2]))
+hotset.flush()
+
+
+@extend('ddserver.config:ConfigDeclaration')
+def config_decl_test(config_decl):
+  # The options required in the configuration file are not used here
+  for options in config_decl.declarations.itervalues():
+    for option, declaration in options.items():
+      if declaration.default is config_decl.REQUIRED:
+        options[option] = declaration._replace(default = '')
+
+
+@extend('ddserver.config:Config')
+def config_test(config):
+  config.logging.file = os.devnull
+  config.recursor.hotset = hotset.name
+
+
+@extend('ddserver.db:Database')
+def database_test(db):
+  return StandInDatabase()
+
+
+
+class WarmTest(unittest.TestCase):
+
+  def setUp(self):
+    self.db = Export.load('ddserver.db:Database').instance
+
+    # Only the queries for hosts are of interest
+    Export.load('ddserver.suffixes:SuffixRegistry').instance.refresh()
+
+    warm()
+
+    del self.db.queries[:]
+
+
+  def test_any(self):
+    records = resolve(HOSTS[0]['fqdn'], 'ANY')
+
+    self.assertEqual([record.content
+                      for record
+                      in records], [HOSTS[0]['address']])
+    self.assertEqual(self.db.queries, [])
+
+
+  def test_a(self):
+    records = resolve(HOSTS[1]['fqdn'].upper(), 'A')
+
+    self.assertEqual([record.content
+                      for record
+                      in records], [HOSTS[1]['address']])
+    self.assertEqual(self.db.queries, [])
+
+
+  def test_cold(self):
+    records = resolve(HOSTS[2]['fqdn'], 'ANY')
+
+    self.assertEqual([record.content
+                      for record
+                      in records], [HOSTS[2]['address']])
+    self.assertEqual(len(self.db.queries), 1)
+
+
+
+if __name__ == '__main__':
+  unittest.main()